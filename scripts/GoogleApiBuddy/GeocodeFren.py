@@ -1,21 +1,69 @@
 ### Author: Ashlynn Wimer
 ### Date: 3/18/2024
 ### About: Helper class for interacting with Geocoder parts of the Google Maps
-###        API. 
+###        API.
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from ResponseCache import FINAL_STATUSES, has_final_status
+from RateLimiter import RateLimiter
 import pandas as pd
 import requests
+import json
+import time
+
+GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+
+# Statuses which mean "try again later"
+RETRY_STATUSES = ['OVER_QUERY_LIMIT', 'UNKNOWN_ERROR']
+
+FAILED = (-999, -999)
 
 class GeocodeFren:
     '''
     Helper class for interacting with Google Maps geocoding API.
     '''
 
-    def __init__(self, API_KEY):
+    def __init__(self, API_KEY, max_workers=8, max_retries=3, backoff=1,
+                 requests_per_second=None, cache=None):
         '''
         Args: API_KEY (str): Your Google API_KEY. (Be sure to store it
           somewhere safe!)
+          max_workers (int): number of requests allowed in flight at once
+            when geocoding in batches. Defaults to 8.
+          max_retries (int): number of times to retry a request that errors
+            out or gets throttled. Defaults to 3.
+          backoff (float): seconds to wait before the first retry; doubles
+            after each failed attempt. Defaults to 1.
+          requests_per_second (float): cap on how many requests are started
+            each second. If None, no cap. Defaults to None.
+          cache (ResponseCache): on-disk cache of geocoder responses. If None,
+            every request goes to the network. Defaults to None.
         '''
         self.API_KEY = API_KEY
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.cache = cache
+
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
+    @staticmethod
+    def normalize(address='', city='', state=''):
+        '''
+        Normalize an address so trivially different spellings of the same
+        place ("123 Main St." vs "123  MAIN ST") are only geocoded once.
+
+        Returns (str tuple): normalized (address, city, state).
+        '''
+        def clean(part):
+            if pd.isna(part):
+                return ''
+            return ' '.join(str(part).upper().replace('.', ' ').replace(',', ' ').split())
+
+        return (clean(address), clean(city), clean(state))
 
     def geocode_point(self, address='', city='', state=''):
         '''
@@ -26,46 +74,42 @@ class GeocodeFren:
           address (str): the street address of the location; opt, default ''
           city (str): the city of the location; opt, default ''
           state (str): the state of the location; opt, default ''
-        
+
         Returns (int tuple): a latitude, longitude pair on WGS84
           pointing to the location described in the address. Defaults
           to city location if full address does not work.
         '''
-        url = 'https://maps.googleapis.com/maps/api/geocode/json'
+        location = self.__lookup(address, city, state)
+        if location is not None:
+            return location
+
+        if address == '':
+            print(f"Failed to geocode {city} {state}, returning (-999), (-999)")
+            return FAILED
+
+        print(f"Initial req didn't take for {address} {city} {state}, trying {city} {state} only")
+        return self.geocode_point(city=city, state=state)
 
-        params = {'sensor':'false',
-                  'address':f'{address} {city} {state}',
-                  'key':self.API_KEY}
-        req = requests.get(url, params=params)
-        try:
-            location = req.json()['results'][0]['geometry']['location']
-            lat, long = location['lat'], location['lng']
-        except IndexError:
-            if address == '':
-                print(f"Failed to geocode {city} {state}, returning (-999), (-999)")
-                return (-999, -999)
-
-            print(f"Initial req didn't take for {address} {city} {state}, trying {city} {state} only")
-            return self.geocode_point(city=city, state=state)
-        
-        return (lat, long)
-    
     def geocode_addresses(self, addresses, ids=None):
         '''
         Given a list of (address, city, state) tuples,
         return a list of of (lat, long) tuples.
 
+        Addresses are normalized and deduplicated first, so each unique
+        address costs at most one call, and each city/state fallback is
+        only resolved once no matter how many addresses need it.
+
         Inputs:
           addresses (list of str tuples, or dataframe): If list of str tuples,
-            then a list of (address, city, state) tuples address, city, or state 
-            can be be excluded by passing ''. 
+            then a list of (address, city, state) tuples address, city, or state
+            can be be excluded by passing ''.
             If a DataFrame, then a DataFrame with an "address", "city", and "state"
             column.
-          ids (optional): Either list of id variables that will be returned as 
+          ids (optional): Either list of id variables that will be returned as
             part of the tuples, or string name of the ID variable column
             If list, must be same length as the addresses list.
             If no id is supplied, uses concat'd addresses as id
-        
+
         Returns: Pandas DataFrame containing ID, Lat, Long
         '''
 
@@ -76,7 +120,7 @@ class GeocodeFren:
             assert 'Address' in addresses.columns, "DataFrame must have 'address' column"
             assert 'State' in addresses.columns, "DataFrame must have 'state' column"
             assert 'City' in addresses.columns, "DataFrame must have 'city' column"
-        
+
         if type(ids) == str:
             ids = addresses[ids]
 
@@ -86,12 +130,94 @@ class GeocodeFren:
         if ids is None:
             ids = [' '.join(address) for address in addresses]
 
+        normalized = [self.normalize(*address) for address in addresses]
+
+        # First pass: every unique full address
+        unique_addresses = list(dict.fromkeys(normalized))
+        print(f'Geocoding {len(unique_addresses)} unique addresses out of {len(normalized)}.')
+        located = dict(zip(unique_addresses, self.__lookup_many(unique_addresses)))
+
+        # Second pass: every unique city/state that a failed address falls back to
+        fallbacks = list(dict.fromkeys(
+            ('', city, state) for (address, city, state), location in located.items()
+            if location is None and address != ''
+        ))
+        if len(fallbacks) > 0:
+            print(f"{len(fallbacks)} city/state fallbacks needed for addresses that didn't take.")
+            located.update(zip(fallbacks, self.__lookup_many(fallbacks)))
+
         coordinates = {'id':[], 'lat':[], 'long':[]}
-        for id_, (address, city, state) in zip(ids, addresses):
-            lat, long = self.geocode_point(address, city, state)
-            coordinates['lat'].append(lat)
-            coordinates['long'].append(long)
+        for id_, (address, city, state) in zip(ids, normalized):
+            location = located[(address, city, state)]
+            if location is None:
+                location = located.get(('', city, state)) or FAILED
+
+            coordinates['lat'].append(location[0])
+            coordinates['long'].append(location[1])
             coordinates['id'].append(id_)
 
         return pd.DataFrame(coordinates)
-    
\ No newline at end of file
+
+    def __lookup_many(self, addresses):
+        '''
+        Look up a list of (address, city, state) tuples through the worker pool.
+
+        Returns: list of (lat, long) tuples, or None where nothing was found.
+        '''
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda address: self.__lookup(*address), addresses))
+
+    def __lookup(self, address='', city='', state=''):
+        '''
+        Geocode a single address, retrying with exponential backoff if the
+        request errors out or gets throttled.
+
+        Returns (float tuple): (lat, long), or None if Google found nothing.
+        '''
+        params = {'sensor':'false',
+                  'address':f'{address} {city} {state}',
+                  'key':self.API_KEY}
+        url = f'{GEOCODE_URL}?{urlencode(params)}'
+
+        resp = self.__request(url)
+        if resp is None or resp['status'] != 'OK':
+            return None
+
+        location = resp['results'][0]['geometry']['location']
+        return (location['lat'], location['lng'])
+
+    def __request(self, url):
+        '''
+        Get the geocoder response for url, from the cache if we have it.
+
+        Returns (dict): the decoded response, or None if every attempt failed.
+        '''
+        if self.cache is not None:
+            # Error bodies cached by older versions are asked again
+            body = self.cache.get(url)
+            if body is not None and has_final_status(body):
+                return json.loads(body)
+
+        wait = self.backoff
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(wait)
+                wait *= 2
+
+            self.rate_limiter.wait()
+            try:
+                req = self.session.get(url)
+                req.raise_for_status()
+                resp = req.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f'Geocoding request failed with {e}, attempt {attempt + 1} of {self.max_retries + 1}.')
+                continue
+
+            if resp.get('status') in RETRY_STATUSES:
+                continue
+
+            if self.cache is not None and resp.get('status') in FINAL_STATUSES:
+                self.cache.put(url, req.content)
+            return resp
+
+        return None
@@ -0,0 +1,45 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Small thread-safe rate limiter shared by the Google API helpers, so
+###        concurrent pulls can saturate our quota without getting throttled.
+
+import threading
+import time
+
+class RateLimiter:
+    '''
+    Spaces out calls so that no more than a given number of requests
+    start in any one second, no matter how many threads are asking.
+    '''
+
+    def __init__(self, requests_per_second=None):
+        '''
+        Arguments:
+          requests_per_second (float): maximum number of requests allowed to
+            start each second. If None, wait() never blocks. Defaults to None.
+        '''
+        assert requests_per_second is None or requests_per_second > 0, 'requests_per_second must be positive.'
+
+        self.interval = 0 if requests_per_second is None else 1 / requests_per_second
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        '''
+        Block until the caller is allowed to send its next request.
+
+        Returns: None
+        '''
+        if self.interval == 0:
+            return
+
+        # Reserve a slot while holding the lock, then sleep outside of it so
+        # other threads can queue up behind us.
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,283 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Persistent, content-addressed cache for Google Maps API responses.
+###        Entries are keyed on the request with the API key stripped out, so
+###        reruns of the pipeline hit the disk instead of our wallet.
+
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import threading
+import requests
+import hashlib
+import sqlite3
+import json
+import time
+import os
+
+# Query parameters which never change the response
+IGNORED_PARAMS = ['key', 'signature']
+
+# Camera parameters only matter for images; metadata for a location is the
+# same whichever way the camera points.
+METADATA_IGNORED_PARAMS = ['heading', 'pitch', 'fov', 'size']
+
+# Google API statuses which are a definite answer. Anything else (e.g.
+# REQUEST_DENIED, OVER_QUERY_LIMIT) comes back with HTTP 200 too, but must
+# not be cached, or one bad key or throttled burst poisons every later run.
+# Shared by everything that decides whether a response needs asking again.
+FINAL_STATUSES = ['OK', 'ZERO_RESULTS', 'NOT_FOUND']
+
+# Hits only record their access time in memory; they are written out in
+# batches of this many
+ACCESS_FLUSH_EVERY = 100
+
+# Seconds to wait on another process holding the database lock before
+# giving up, for caches shared between processes
+BUSY_TIMEOUT = 30
+
+def has_final_status(body):
+    '''
+    Returns (bool): whether a JSON response body carries a status in
+      FINAL_STATUSES.
+    '''
+    try:
+        return json.loads(body).get('status') in FINAL_STATUSES
+    except (ValueError, AttributeError):
+        return False
+
+class ResponseCache:
+    '''
+    SQLite backed cache of raw API response bodies.
+    '''
+
+    def __init__(self, path, ttl=None, max_bytes=None, timeout=BUSY_TIMEOUT):
+        '''
+        Open (or create) a cache at path.
+
+        Arguments:
+          path (str): location of the SQLite file backing the cache.
+          ttl (float): seconds an entry stays valid for. If None, entries never
+            expire. Defaults to None.
+          max_bytes (int): once the stored bodies exceed this size, the least
+            recently used entries are evicted. If None, the cache is unbounded.
+            Defaults to None.
+          timeout (float): seconds to wait for another process's write to
+            finish. Defaults to BUSY_TIMEOUT.
+        '''
+        if os.path.dirname(path) != '':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        # One connection shared across threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute(f'PRAGMA busy_timeout={int(timeout * 1000)}')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS responses (
+                 key TEXT PRIMARY KEY,
+                 request TEXT,
+                 body BLOB,
+                 size INTEGER,
+                 created REAL,
+                 accessed REAL
+               )'''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._conn.commit()
+
+        # Running total of stored bytes, so puts don't rescan the table
+        self._total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+        # key -> last access time, not yet written to the database
+        self._accessed = {}
+
+    @staticmethod
+    def canonicalize(url):
+        '''
+        Turn a request URL into a canonical string: the API key (and, for
+        metadata requests, the camera parameters) is removed, parameters are
+        sorted, and runs of whitespace in values are collapsed to one space
+        (so "123  MAIN ST" and "123 MAIN ST" match, but "12 34TH ST" and
+        "123 4TH ST" don't).
+
+        Returns (str): the canonical request.
+        '''
+        parts = urlsplit(url)
+        ignored = IGNORED_PARAMS
+        if parts.path.endswith('/metadata'):
+            ignored = IGNORED_PARAMS + METADATA_IGNORED_PARAMS
+
+        params = sorted(
+            (name, ' '.join(value.split()))
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if name not in ignored
+        )
+        return f'{parts.netloc}{parts.path}?{urlencode(params)}'
+
+    @staticmethod
+    def cache_key(url):
+        '''
+        Returns (str): the content address for a request URL.
+        '''
+        return hashlib.sha256(ResponseCache.canonicalize(url).encode()).hexdigest()
+
+    def get(self, url):
+        '''
+        Look up the cached body for a request.
+
+        Returns (bytes): the cached body, or None on a miss.
+        '''
+        key = self.cache_key(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            body, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self.__delete([key])
+                self._conn.commit()
+                return None
+
+            self._accessed[key] = now
+            if len(self._accessed) >= ACCESS_FLUSH_EVERY:
+                self.__flush_accessed()
+                self._conn.commit()
+
+        return body
+
+    def put(self, url, body):
+        '''
+        Store the body returned for a request, then evict down to max_bytes.
+
+        Returns: None
+        '''
+        key = self.cache_key(url)
+        now = time.time()
+        with self._lock:
+            # Replacing an entry frees its old body
+            self.__delete([key])
+            self._conn.execute(
+                'INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, self.canonicalize(url), body, len(body), now, now)
+            )
+            self._total += len(body)
+            self.__evict()
+            self._conn.commit()
+
+    def fetch(self, url, session=None, cacheable=None, before_request=None):
+        '''
+        Return the body for a request, going to the network only on a miss.
+        Only successful responses are stored.
+
+        Inputs:
+          url (str): the request URL, API key included.
+          session (requests.Session): session to make the request with. If
+            None, uses requests.get. Defaults to None.
+          cacheable (function): takes a response body and returns whether it
+            may be cached. Cached bodies it rejects count as misses. If None,
+            every successful response is cached. Defaults to None.
+          before_request (function): called just before going to the
+            network, e.g. a rate limiter's wait. Defaults to None.
+
+        Returns (bytes): the response body, or None if the request failed.
+        '''
+        body = self.get(url)
+        if body is not None and (cacheable is None or cacheable(body)):
+            return body
+
+        if before_request is not None:
+            before_request()
+        resp = (session or requests).get(url)
+        if not resp.ok:
+            return None
+
+        if cacheable is None or cacheable(resp.content):
+            self.put(url, resp.content)
+        return resp.content
+
+    def fetch_json(self, url, session=None, before_request=None):
+        '''
+        fetch(), but decoding the body as JSON. Only responses with a status
+        in FINAL_STATUSES are cached; others are returned but not stored.
+
+        Returns (dict): the decoded response, or None if the request failed.
+        '''
+        body = self.fetch(url, session, cacheable=has_final_status, before_request=before_request)
+        return None if body is None else json.loads(body)
+
+    def clear_expired(self):
+        '''
+        Drop every entry older than the TTL.
+
+        Returns: None
+        '''
+        if self.ttl is None:
+            return
+
+        with self._lock:
+            expired = [key for (key,) in self._conn.execute(
+                'SELECT key FROM responses WHERE created < ?', (time.time() - self.ttl,)
+            )]
+            self.__delete(expired)
+            self._conn.commit()
+
+    def close(self):
+        '''
+        Write out pending access times and close the database connection.
+        '''
+        with self._lock:
+            self.__flush_accessed()
+            self._conn.commit()
+            self._conn.close()
+
+    def __flush_accessed(self):
+        '''
+        Write the buffered access times to the database. Must be called while
+        holding the lock.
+        '''
+        self._conn.executemany(
+            'UPDATE responses SET accessed = ? WHERE key = ?',
+            [(accessed, key) for key, accessed in self._accessed.items()]
+        )
+        self._accessed = {}
+
+    def __delete(self, keys):
+        '''
+        Delete entries, keeping the running total in step. Must be called while
+        holding the lock.
+        '''
+        for key in keys:
+            row = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                continue
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._total -= row[0]
+            self._accessed.pop(key, None)
+
+    def __evict(self):
+        '''
+        Delete least recently accessed entries until we are under max_bytes.
+        Must be called while holding the lock.
+        '''
+        if self.max_bytes is None or self._total <= self.max_bytes:
+            return
+
+        # Eviction goes by access time, so it needs the buffered ones
+        self.__flush_accessed()
+
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if self._total - freed <= self.max_bytes:
+                break
+            victims.append(key)
+            freed += size
+
+        self.__delete(victims)
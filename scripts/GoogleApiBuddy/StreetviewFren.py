@@ -1,12 +1,20 @@
 ### Author: Ashlynn Wimer
-### Last Modified: 3/26/2024
+### Last Modified: 10/17/2026
 ### About: Helper class for interacting with Google Maps Streetview API.
 
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from RateLimiter import RateLimiter
 from PIL import Image
 from io import BytesIO
 import numpy as np
 import pandas as pd
 import requests
+import json
+import csv
+import os
+
+METADATA_FIELDS = ['lat', 'long', 'copyright', 'date', 'pano_id', 'status']
 
 class StreetviewFren:
     '''
@@ -16,7 +24,8 @@ class StreetviewFren:
     def __init__(self, API_KEY, locs=None, 
                  fov=90, pitch=0, 
                  radius=50, size = (600, 400), 
-                 source='outdoor'):
+                 source='outdoor', max_in_flight=8,
+                 requests_per_second=None, cache=None):
         '''
         Define self and set initial parameters
 
@@ -35,7 +44,16 @@ class StreetviewFren:
             width x height format. Maximum is 640x640. Defaults to (600, 400). 
           source (str): "default" if allowing indoor panoramas, "outdoor" for
             only outdoor panoramas. Defaults to "outdoor".        
+          max_in_flight (int): maximum number of requests allowed to be
+            waiting on Google at once. Defaults to 8.
+          requests_per_second (float): cap on how many requests are started
+            each second, to stay under Google's throttling. If None, requests
+            are only limited by max_in_flight. Defaults to None.
+          cache (ResponseCache): on-disk cache to serve repeated requests
+            from. If None, every request goes to the network. Defaults to None.
         '''
+        assert max_in_flight >= 1, 'max_in_flight must be at least 1.'
+
         # Constants
         self.METADATA_URL = 'https://maps.googleapis.com/maps/api/streetview/metadata?'
         self.IMAGE_URL = 'https://maps.googleapis.com/maps/api/streetview?'
@@ -49,6 +67,13 @@ class StreetviewFren:
         self.size = size
         self.source = source
 
+        # Concurrency info -- one pooled session shared by every worker
+        self.max_in_flight = max_in_flight
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('https://', adapter)
+        self.cache = cache
         
         self.rdf = None
 
@@ -102,6 +127,87 @@ class StreetviewFren:
         # Save everything
         self.__save_images(file_loc, self.rdf['id'].values, self.rdf['image'].values)
         self.__save_metadata(file_loc, self.rdf.drop(['image'], axis=1), metadata_name)
+
+    def stream(self, file_loc=None, sink=None, minimize_spending=False, image_file_type='jpg'):
+        '''
+        Acquire images and metadata one location at a time, handing each image's
+        raw bytes off as soon as it arrives instead of holding every image in
+        memory. Images are never decoded.
+
+        Inputs:
+          file_loc (str): folder to write images into as {id}.{image_file_type}.
+            Opt, default None.
+          sink (function): called as sink(id, image_bytes) for every image
+            retrieved. Opt, default None. At least one of file_loc or sink
+            must be given.
+          minimize_spending (bool): If true, requests the image only for
+            locations with extant metadata. Defaults False.
+          image_file_type (str): defaults to jpg, is not inferred.
+
+        Yields: dict of metadata for each location (id, lat, long, copyright,
+          date, pano_id, status, image_saved), in the same order as locs.
+        '''
+        assert not (file_loc is None and sink is None), 'Must provide a file_loc or sink to stream images to.'
+
+        metadata_urls = self.__generate_requests(use_metadata_url=True)
+        image_urls = self.__generate_requests(use_metadata_url=False)
+
+        def fetch(i):
+            row = {'id':f'I{i}'}
+            row.update(zip(METADATA_FIELDS, self.__parse_metadata(self.__fetch_metadata(metadata_urls[i]))))
+
+            row['image_saved'] = False
+            if minimize_spending and pd.isna(row['status']):
+                return row
+
+            content = self.__fetch_image_bytes(image_urls[i])
+            if content is None:
+                return row
+
+            if file_loc is not None:
+                with open(f'{file_loc}/{row["id"]}.{image_file_type}', 'wb') as f:
+                    f.write(content)
+            if sink is not None:
+                sink(row['id'], content)
+            row['image_saved'] = True
+
+            return row
+
+        # Only keep a window of max_in_flight locations going at once, so
+        # memory stays flat no matter how many locations we have.
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            window = []
+            for i in range(len(image_urls)):
+                window.append(executor.submit(fetch, i))
+                if len(window) >= self.max_in_flight:
+                    yield window.pop(0).result()
+            for future in window:
+                yield future.result()
+
+    def stream_save(self, file_loc, metadata_name='metadata', minimize_spending=False, image_file_type='jpg'):
+        '''
+        Stream images straight to file_loc, appending each location's metadata
+        to {metadata_name}.csv as it arrives.
+
+        Inputs:
+          file_loc (str): the folder to store the metadata and images in.
+          metadata_name (str): the name of the metadata file, not including file type.
+          minimize_spending (bool): If true, requests the image only for
+            locations with extant metadata. Defaults False.
+          image_file_type (str): defaults to jpg, is not inferred.
+
+        Returns (int): the number of images saved.
+        '''
+        n_saved = 0
+        with open(os.path.join(file_loc, f'{metadata_name}.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['id'] + METADATA_FIELDS + ['image_saved'])
+            writer.writeheader()
+            for row in self.stream(file_loc, minimize_spending=minimize_spending,
+                                   image_file_type=image_file_type):
+                writer.writerow(row)
+                n_saved += row['image_saved']
+
+        return n_saved
             
     def __save_images(self, file_loc, ids, images, image_file_type='jpg'):
         '''
@@ -129,32 +235,77 @@ class StreetviewFren:
 
         urls = self.__generate_requests(use_metadata_url=True)
 
-        resp_df = pd.DataFrame({'metadataUrl':[], 'lat':[], 'long':[], 
-                           'copyright':[], 'date':[], 'pano_id':[], 
-                           'status':[]})
-        for url in urls:
-            resp = requests.get(url).json()
-
-            # Add a new row -- if we get errors, there is no image there, so
-            # just add NAs for later handling
-            try:
-                new_row = pd.DataFrame(
-                            {'metadataUrl':[url],
-                             'lat':[resp['location']['lat']], 'long':[resp['location']['lng']],
-                             'copyright':[resp['copyright']], 'date':[resp['date']],
-                             'pano_id':[resp['pano_id']], 'status':[resp['status']]}
-                        )
-            except KeyError:
-                new_row = pd.DataFrame(
-                    {'metadataUrl':[url], 'lat':[pd.NA], 'long':[pd.NA],
-                     'copyright':[pd.NA], 'date':[pd.NA], 'pano_id':[pd.NA],
-                     'status':[pd.NA]}
-                )
-            
-            # Update our DataFrame
-            resp_df = pd.concat([resp_df, new_row], ignore_index=True)
+        resps = self.__fetch_all(urls, self.__fetch_metadata)
+
+        # Build the columns up as lists and make the DataFrame once at the end;
+        # concatenating row by row is quadratic in the number of locations.
+        cols = {'metadataUrl':[], 'lat':[], 'long':[], 'copyright':[],
+                'date':[], 'pano_id':[], 'status':[]}
+        for url, resp in zip(urls, resps):
+            cols['metadataUrl'].append(url)
+            for col, val in zip(METADATA_FIELDS, self.__parse_metadata(resp)):
+                cols[col].append(val)
+
+        return pd.DataFrame(cols)
 
-        return resp_df
+    def __parse_metadata(self, resp):
+        '''
+        Pull the fields we keep out of a metadata response. If the response
+        is missing keys, there is no image there, so just return NAs for
+        later handling.
+
+        Returns: tuple of values matching METADATA_FIELDS.
+        '''
+        try:
+            return (resp['location']['lat'], resp['location']['lng'],
+                    resp['copyright'], resp['date'], resp['pano_id'],
+                    resp['status'])
+        except KeyError:
+            return (pd.NA,) * len(METADATA_FIELDS)
+
+    def __fetch_metadata(self, url):
+        '''
+        Request the metadata at a single URL, respecting the rate cap.
+        Cache hits skip the network (and the rate cap) entirely.
+
+        Returns: dict of the JSON response.
+        '''
+        if self.cache is None:
+            self.rate_limiter.wait()
+            return self.session.get(url).json()
+
+        resp = self.cache.fetch_json(url, self.session, before_request=self.rate_limiter.wait)
+        return {} if resp is None else resp
+
+    def __fetch_image_bytes(self, url):
+        '''
+        Request the raw image at a single URL, respecting the rate cap.
+
+        Returns (bytes): the image body, or None if no image was returned.
+        '''
+        if self.cache is not None:
+            return self.cache.fetch(url, self.session, before_request=self.rate_limiter.wait)
+
+        self.rate_limiter.wait()
+        resp = self.session.get(url)
+        return resp.content if resp.ok else None
+
+    def __fetch_all(self, urls, fetch):
+        '''
+        Apply fetch to every URL with at most max_in_flight requests
+        running at once.
+
+        Inputs:
+          urls (list of str): API Request URLs
+          fetch (function): called on each URL
+
+        Returns: list of fetch results, in the same order as urls.
+        '''
+        if self.max_in_flight == 1:
+            return [fetch(url) for url in urls]
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            return list(executor.map(fetch, urls))
     
     def __get_images(self, urls=None):
         '''
@@ -170,12 +321,10 @@ class StreetviewFren:
         if urls is None:
             urls = self.__generate_requests(use_metadata_url=False)
 
-        imgs = []
-        for url in urls:
-            resp = requests.get(url)
-            print(resp.content)
-            img = Image.open(BytesIO(resp.content))
-            imgs.append(img)
+        def fetch(url):
+            return Image.open(BytesIO(self.__fetch_image_bytes(url)))
+
+        imgs = self.__fetch_all(list(urls), fetch)
 
         return pd.DataFrame({'imageUrl':urls, 'image':imgs})
 
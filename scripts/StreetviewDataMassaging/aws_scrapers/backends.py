@@ -0,0 +1,259 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Execution backends for the image scrape. Both take the same batches
+###        pull_images.py builds (a list of lambda events) and return which
+###        IDs were uploaded, skipped or failed, so a scrape can run through
+###        Step Functions + Lambda or entirely on this machine.
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from initialize_aws import BUCKET, STEP_FUNCTION_NAME, RESERVED_CONCURRENCY
+import boto3
+import json
+import time
+import uuid
+import sys
+import os
+
+DEPLOYMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deployment_packages')
+GOOGLE_API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'GoogleApiBuddy')
+
+# Kept apart from validate_points.py's cache, so a local scrape can't evict
+# or lock the metadata that run paid for
+LOCAL_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', '..', 'data', 'cache', 'local_scrape_responses.sqlite')
+LOCAL_CACHE_MAX_BYTES = 256 * 1024**2
+
+OUTCOMES = ['uploaded', 'skipped', 'failed']
+
+def batch_ids(batch):
+    '''
+    Returns (list): the IDs requested in one lambda event.
+    '''
+    reqs = batch['requests'] if isinstance(batch, dict) else batch
+    return [req['ID'] for req in reqs]
+
+def merge_results(batches, results, exists=None):
+    '''
+    Combine the per-batch results returned by lambda_handler. A batch with no
+    result (e.g. its invocation errored out) counts as failed, except for any
+    images it stored before erroring.
+
+    Inputs:
+      batches (list): the lambda events.
+      results (list): lambda_handler's result for each batch, or None.
+      exists (function): takes a list of IDs and returns the ones whose image
+        is already stored. If None, batches with no result are entirely
+        failed. Defaults to None.
+
+    Returns (dict): outcome -> list of IDs, over every batch.
+    '''
+    merged = {outcome: [] for outcome in OUTCOMES}
+    for batch, result in zip(batches, results):
+        if not isinstance(result, dict):
+            ids = batch_ids(batch)
+            stored = set(exists(ids)) if exists is not None else set()
+            merged['uploaded'].extend(point_id for point_id in ids if point_id in stored)
+            merged['failed'].extend(point_id for point_id in ids if point_id not in stored)
+            continue
+        for outcome in OUTCOMES:
+            merged[outcome].extend(result.get(outcome, []))
+
+    return merged
+
+def stored_in_bucket(s3, bucket, ids):
+    '''
+    Check which images are already in a bucket, e.g. to avoid paying for
+    them again after a failed execution.
+
+    Returns (list): the IDs whose image is in the bucket.
+    '''
+    def stored(point_id):
+        try:
+            s3.head_object(Bucket=bucket, Key=point_id)
+            return True
+        except ClientError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        return [point_id for point_id, found in zip(ids, executor.map(stored, ids)) if found]
+
+class StepFunctionsBackend:
+    '''
+    Runs batches through the Step Functions state machine set up by
+    initialize_aws.py, one Lambda invocation per batch. The clients are
+    thread-safe, so several executions can be run at once.
+    '''
+
+    def __init__(self, state_machine_name=STEP_FUNCTION_NAME, bucket=BUCKET,
+                 max_concurrency=RESERVED_CONCURRENCY):
+        '''
+        Arguments:
+          state_machine_name (str): name of the state machine to execute.
+            Defaults to STEP_FUNCTION_NAME.
+          bucket (str): bucket the lambdas upload to. Defaults to BUCKET.
+          max_concurrency (int): lambdas which can run at once; more are
+            throttled. Defaults to RESERVED_CONCURRENCY.
+        '''
+        self.sfn = boto3.client('stepfunctions')
+        self.s3 = boto3.client('s3')
+        self.bucket = bucket
+        self.max_concurrency = max_concurrency
+        self.state_machine_arn = [
+            sm['stateMachineArn'] for sm in self.sfn.list_state_machines()['stateMachines']
+            if sm['name'] == state_machine_name
+        ][0]
+        self.state_machine_name = state_machine_name
+
+    def run(self, batches):
+        '''
+        Execute the state machine over batches and wait for it to finish. A
+        failed execution returns no per-batch output, so the bucket is checked
+        for images it managed to upload before they are counted as failed.
+
+        Returns (tuple): (outcome -> list of IDs, seconds the execution ran
+          for, not counting time spent waiting to start).
+        '''
+        try:
+            response = self.sfn.start_sync_execution(
+                stateMachineArn=self.state_machine_arn,
+                name=f'{self.state_machine_name}-{uuid.uuid4().hex[:12]}',
+                input=json.dumps(batches)
+            )
+        except (BotoCoreError, ClientError) as e:
+            print(f'Execution failed to run with {e}.')
+            return merge_results(batches, [None] * len(batches), self.exists), None
+
+        seconds = (response['stopDate'] - response['startDate']).total_seconds()
+        if response['status'] != 'SUCCEEDED':
+            print(f'Execution ended with status {response["status"]}: {response.get("error")}.')
+            return merge_results(batches, [None] * len(batches), self.exists), seconds
+
+        return merge_results(batches, json.loads(response['output'])), seconds
+
+    def close(self):
+        '''
+        Nothing to shut down; here so both backends can be used the same way.
+        '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def exists(self, ids):
+        '''
+        Returns (list): the IDs whose image is already in the bucket.
+        '''
+        return stored_in_bucket(self.s3, self.bucket, ids)
+
+def _init_worker(environment):
+    '''
+    Set up a local worker: configure lambda_function through its environment
+    variables, then import it so its clients are created once per process,
+    like a warm Lambda container.
+    '''
+    os.environ.update(environment)
+    # ResponseCache is copied into the package at build time; locally it is
+    # imported from where it lives
+    sys.path.append(DEPLOYMENT_DIR)
+    sys.path.append(GOOGLE_API_DIR)
+    global lambda_function
+    import lambda_function
+
+def _invoke(batch):
+    '''
+    Run lambda_handler on one batch inside a local worker.
+
+    Returns (tuple): (lambda_handler's result, or None if it raised, seconds
+      the batch ran for).
+    '''
+    start = time.time()
+    try:
+        result = lambda_function.lambda_handler(batch, None)
+    except Exception as e:
+        print(f'Local invocation failed with {e}.')
+        result = None
+
+    return result, time.time() - start
+
+class LocalBackend:
+    '''
+    Runs batches through lambda_handler in a local process pool, writing
+    images to a folder or to an S3-compatible endpoint. No AWS account needed
+    for the former.
+    '''
+
+    def __init__(self, max_workers=None, output_dir=None, endpoint_url=None,
+                 bucket=None, cache_path=LOCAL_CACHE_PATH, cache_max_bytes=LOCAL_CACHE_MAX_BYTES):
+        '''
+        Arguments:
+          max_workers (int): batches run at once, like Lambda's reserved
+            concurrency. If None, one per CPU. Defaults to None.
+          output_dir (str): folder to write images to. If None, images are
+            uploaded to the bucket instead. Defaults to None.
+          endpoint_url (str): S3-compatible endpoint to upload to, e.g. a
+            local MinIO at http://localhost:9000. If None, uses AWS.
+            Defaults to None.
+          bucket (str): bucket to upload to. If None, uses lambda_function's
+            default. Defaults to None.
+          cache_path (str): response cache shared by the workers. Only
+            metadata calls are cached; images are not. Defaults to
+            data/cache/local_scrape_responses.sqlite.
+          cache_max_bytes (int): size the response cache is evicted down to.
+            Defaults to LOCAL_CACHE_MAX_BYTES.
+        '''
+        self.output_dir = output_dir
+        self.bucket = bucket
+        self.s3 = boto3.client('s3', endpoint_url=endpoint_url) if output_dir is None else None
+
+        # The process pool already bounds how many batches run at once
+        self.max_concurrency = None
+
+        environment = {'RESPONSE_CACHE_PATH':cache_path,
+                       'RESPONSE_CACHE_MAX_BYTES':str(cache_max_bytes),
+                       'CACHE_IMAGES':'0'}
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+            environment['OUTPUT_DIR'] = output_dir
+        if endpoint_url is not None:
+            environment['S3_ENDPOINT_URL'] = endpoint_url
+        if bucket is not None:
+            environment['BUCKET'] = bucket
+
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                            initargs=(environment,))
+
+    def run(self, batches):
+        '''
+        Run every batch and wait for them all to finish.
+
+        Returns (tuple): (outcome -> list of IDs, seconds the slowest batch
+          ran for, not counting time spent waiting for a worker).
+        '''
+        results, seconds = zip(*self.executor.map(_invoke, batches))
+        return merge_results(batches, results, self.exists), max(seconds)
+
+    def exists(self, ids):
+        '''
+        Returns (list): the IDs whose image is already in the output folder
+          or bucket.
+        '''
+        if self.output_dir is not None:
+            return [point_id for point_id in ids
+                    if os.path.exists(os.path.join(self.output_dir, f'{point_id}.png'))]
+
+        return stored_in_bucket(self.s3, self.bucket or BUCKET, ids)
+
+    def close(self):
+        '''
+        Shut the worker processes down.
+        '''
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,42 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: This script builds the lambda deployment package initialize_aws.py
+###        uploads: the handler, a copy of the shared ResponseCache module, and
+###        the handler's third party dependencies.
+
+import subprocess
+import tempfile
+import zipfile
+import sys
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEPLOYMENT_DIR = os.path.join(HERE, 'deployment_packages')
+PACKAGE_PATH = os.path.join(DEPLOYMENT_DIR, 'chicago-places-deployment-package.zip')
+
+# Modules copied into the package root, alongside the handler
+MODULES = [
+    os.path.join(DEPLOYMENT_DIR, 'lambda_function.py'),
+    os.path.join(HERE, '..', '..', 'GoogleApiBuddy', 'ResponseCache.py'),
+]
+
+# boto3 ships with the Lambda runtime; requests does not
+DEPENDENCIES = ['requests']
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as build_dir:
+        print('Installing dependencies...')
+        subprocess.run([sys.executable, '-m', 'pip', 'install', '--quiet',
+                        '--target', build_dir] + DEPENDENCIES, check=True)
+
+        print(f'Writing {PACKAGE_PATH}...')
+        with zipfile.ZipFile(PACKAGE_PATH, 'w', zipfile.ZIP_DEFLATED) as package:
+            for root, _, files in os.walk(build_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    package.write(path, os.path.relpath(path, build_dir))
+
+            for module in MODULES:
+                package.write(module, os.path.basename(module))
+
+    print('Package built!')
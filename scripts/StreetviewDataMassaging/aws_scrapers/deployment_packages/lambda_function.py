@@ -2,15 +2,50 @@
 ### Date: 5/16/2024
 ### About: Lambda function which is used to retrieve images from Google Streetview.
 
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from botocore.config import Config
+from ResponseCache import ResponseCache # copied in by build_deployment_package.py
 from io import BytesIO
-import boto3
 import requests
+import boto3
 import logging
+import os
 
 METADATA_URL = 'https://maps.googleapis.com/maps/api/streetview/metadata?'
 IMAGE_URL = 'https://maps.googleapis.com/maps/api/streetview?'
 IMG_SIZE = (600, 400)
-BUCKET = 'chicago-places-buckette'
+BUCKET = os.environ.get('BUCKET', 'chicago-places-buckette')
+
+# When set, images are written to this folder instead of S3, e.g. when run
+# through the local backend in backends.py
+OUTPUT_DIR = os.environ.get('OUTPUT_DIR')
+
+# Images fetched and uploaded at once within one invocation
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', 16))
+
+# Whether batches are trusted to be pre-validated (validate_points.py already
+# made the metadata call) when the event doesn't say
+TRUSTED_INPUT = os.environ.get('TRUSTED_INPUT') == '1'
+
+# Whether image bodies go through the response cache. Worth it in /tmp on
+# Lambda, but locally images are already kept in OUTPUT_DIR
+CACHE_IMAGES = os.environ.get('CACHE_IMAGES', '1') == '1'
+
+# Clients live at module level so they are created once per container and
+# reused across invocations while it stays warm. Both are thread-safe.
+# S3_ENDPOINT_URL points the client at an S3-compatible stand-in (e.g. MinIO)
+S3 = boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+                  config=Config(max_pool_connections=MAX_WORKERS))
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+
+# Only /tmp is writable on Lambda; it survives for as long as the container
+# stays warm, so repeated calls within a container skip the network.
+CACHE = ResponseCache(
+    os.environ.get('RESPONSE_CACHE_PATH', '/tmp/streetview_responses.sqlite'),
+    max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 256 * 1024**2))
+)
 
 
 def generate_request_url(loc: tuple, API_KEY: str, heading: int, metadata: bool=True) -> str:
@@ -40,9 +75,9 @@ def is_valid_call(loc: tuple, API_KEY: str, heading: int) -> bool:
     '''
 
     metadata_url = generate_request_url(loc, API_KEY, heading, True)
-    metadata = requests.get(metadata_url).json()
+    metadata = CACHE.fetch_json(metadata_url, SESSION)
 
-    if metadata['status'] == 'OK':
+    if metadata is not None and metadata['status'] == 'OK':
         return True
     
     return False
@@ -50,52 +85,96 @@ def is_valid_call(loc: tuple, API_KEY: str, heading: int) -> bool:
 def get_image(loc: tuple, API_KEY: str, heading: int) -> BytesIO:
     '''
     Given a single coordinate, attempt to grab the image at that location
-    and return it as a BytesIO object. 
+    and return it as a BytesIO object, or None if the request failed.
     '''
 
     url = generate_request_url(loc, API_KEY, heading, False)
-    resp = requests.get(url)    
-    
-    return BytesIO(resp.content)
+    if CACHE_IMAGES:
+        content = CACHE.fetch(url, SESSION)
+    else:
+        resp = SESSION.get(url)
+        content = resp.content if resp.ok else None
+
+    if content is None:
+        return None
+
+    return BytesIO(content)
+
+def store_image(image_bytes: BytesIO, key: str) -> None:
+    '''
+    Save an image to OUTPUT_DIR if set, otherwise upload it to the bucket.
+    upload_fileobj only returns once S3 has the object, so there is no need
+    to poll for it afterwards.
+    '''
+    if OUTPUT_DIR is not None:
+        # Street View sends JPEGs; convert them to PNGs named like
+        # save_images_to_local.py's downloads. Pillow is only needed locally,
+        # so it isn't part of the deployment package.
+        from PIL import Image
+        Image.open(image_bytes).save(os.path.join(OUTPUT_DIR, f'{key}.png'))
+        return
+
+    S3.upload_fileobj(
+        Fileobj=image_bytes,
+        Bucket=BUCKET,
+        Key=key,
+        ExtraArgs={'ContentType':'image/png'}
+    )
     
+def scrape(req: dict, trusted: bool) -> str:
+    '''
+    Grab the image for a single request and store it.
+
+    Returns (str): 'uploaded', 'skipped' if the metadata check failed, or
+      'failed'.
+    '''
+    key = req.get('ID')
+    try:
+        loc = (req['latitude'], req['longitude'])
+        API_KEY = req['API_KEY']
+        heading = req['heading']
+
+        # Double check our call is valid, unless the batch was already validated
+        if not trusted and not is_valid_call(loc, API_KEY, heading):
+            logging.warning(f'Skipping image with ID {key} as we cannot verify it.')
+            return 'skipped'
+
+        image_bytes = get_image(loc, API_KEY, heading)
+        if image_bytes is None:
+            logging.warning(f'Failed to grab image with ID {key}.')
+            return 'failed'
+
+        store_image(image_bytes, key)
+        return 'uploaded'
+    except Exception as e:
+        logging.warning(f'Hit exception {e} on image {key}. Continuing to next row.')
+        return 'failed'
+
 # Image upload code partially scribbed from
 # https://stackoverflow.com/a/76593762
 def lambda_handler(event, context):
     '''
-    Handle the lambda call by grabbing an image and sending it to
-    S3
+    Handle the lambda call by grabbing a batch of images concurrently and
+    sending them to S3 (or OUTPUT_DIR).
+
+    The event is either a list of requests, or a dict with a 'requests' list
+    and a 'trusted' flag. Trusted batches skip the metadata check, since
+    validate_points.py already made it.
+
+    Returns (dict): the IDs which were 'uploaded', 'skipped' and 'failed'.
     '''
-    
-    for req in event:
-        try:
-            loc = (req['latitude'], req['longitude'])
-            API_KEY = req['API_KEY']
-            heading = req['heading']
-            key = req['ID']
-
-            # Double check our call is valid; if not, return 400. 
-            if not is_valid_call(loc, API_KEY, heading):
-                logging.warn(f'Skipping image with ID {req["ID"]} as we cannot verify it.')
-                continue
-
-            image_bytes = get_image(loc, API_KEY, heading)
-
-            s3_client = boto3.client('s3')
-            s3_resource = boto3.resource('s3')
-
-            s3_client.upload_fileobj(
-                Fileobj=image_bytes,
-                Bucket=BUCKET,
-                Key=key,
-                ExtraArgs={'ContentType':'image/png'},
-                Callback=None,
-                Config=None
-            )
-
-            # We're not intentionally rate limiting (which is a little
-            # impolite for Google), so we can at least be slightly
-            # polite by waiting for processes like this to finish.
-            s3_resource.Object(BUCKET, key).wait_until_exists()
-        except Exception as e:
-            logging.warn(f'Hit exception {e} on image {req.ID}. Continuing to next row.')
-            continue
\ No newline at end of file
+    if isinstance(event, dict):
+        reqs = event['requests']
+        trusted = event.get('trusted', TRUSTED_INPUT)
+    else:
+        reqs = event
+        trusted = TRUSTED_INPUT
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        outcomes = list(executor.map(lambda req: scrape(req, trusted), reqs))
+
+    results = {'uploaded':[], 'skipped':[], 'failed':[]}
+    for req, outcome in zip(reqs, outcomes):
+        results[outcome].append(req.get('ID'))
+
+    return results
@@ -10,6 +10,9 @@ BUCKET = 'chicago-places-buckette'
 LAMBDA_FUNCTION_NAME = 'scrape_image'
 STEP_FUNCTION_NAME = 'chicago-places-state-machine'
 
+# Lambdas allowed to run at once; backends.py imports this to cap the scrape
+RESERVED_CONCURRENCY = 10
+
 def make_def(lambda_arn: str) -> dict:
     '''
     Make the definition for our step function.
@@ -98,7 +101,7 @@ if __name__ == "__main__":
 
     response = aws_lambda.put_function_concurrency(
         FunctionName=LAMBDA_FUNCTION_NAME,
-        ReservedConcurrentExecutions=10
+        ReservedConcurrentExecutions=RESERVED_CONCURRENCY
     )  
 
     sf_def = make_def(lambda_arn)
@@ -1,71 +1,131 @@
 ### Author: Ashlynn Wimer
 ### Date: 5/17/2024
 ### About: This script calls a set of lambda functions which retrieve images
-###        from the Google Streetview API and saves them into an S3 bucket. 
+###        from the Google Streetview API and saves them into an S3 bucket,
+###        either through Step Functions or a local process pool.
 
+from backends import StepFunctionsBackend, LocalBackend
+from scheduler import SuperbatchScheduler
 import pandas as pd
-import numpy as np
+import argparse
 import json
-import boto3
+import sys
 import os
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from artifacts import read_artifact
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dedup_panoramas import image_ids
+
 LAMBDA_FUNCTION_NAME = 'scrape_image'
 STEP_FUNCTION_NAME = 'chicago-places-state-machine'
 API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY_CHICAGO')
 
-def generate_request_batches(df: pd.DataFrame, n_batches: int=10) -> list:
+# Outcome of every request sent so far, per backend, so reruns only send
+# the images still missing
+PROGRESS_PATH = '../../../data/cache/scrape/progress_{backend}.jsonl'
+
+def generate_requests(df: pd.DataFrame) -> list:
+    '''
+    Generate a lambda request for every row of df.
+    '''
+    return [
+        {'ID':str(point_id), 'latitude':float(lat), 'longitude':float(lon),
+         'heading':int(heading), 'API_KEY':API_KEY}
+        for point_id, lat, lon, heading
+        in df[['ID', 'latitude', 'longitude', 'heading']].itertuples(index=False, name=None)
+    ]
+
+def save_batches(batches: list, path: str) -> None:
     '''
-    Generate n_batches of JSONs containing n_int requests for our lambda requests. 
+    Save batches to a JSON file, without the API key.
     '''
+    stripped = [
+        {**batch, 'requests':[{k: v for k, v in req.items() if k != 'API_KEY'} for req in batch['requests']]}
+        for batch in batches
+    ]
+    with open(path, 'w') as f:
+        json.dump(stripped, f)
+
+def load_batches(path: str) -> list:
+    '''
+    Load batches saved by save_batches, filling the API key back in.
+    '''
+    with open(path) as f:
+        batches = json.load(f)
+
+    for batch in batches:
+        for req in batch['requests']:
+            req['API_KEY'] = API_KEY
 
-#    assert rows_per_batch * n_batches <= len(df), 'DataFrame must have fewer rows than the number of requested batches.'
-
-    dfs = [pd.DataFrame(x) for x in np.array_split(df, n_batches)]
-
-    batches = []
-    for df in dfs:
-        requests = []
-        for _, row in df.iterrows():
-            requests.append(
-                {
-                    'ID':row['ID'],
-                    'latitude':row['latitude'],
-                    'longitude':row['longitude'],
-                    'heading':row['heading'],
-                    'API_KEY':API_KEY
-                }
-            )
-        batches.append(requests)
-    
     return batches
 
-if __name__ == '__main__':    
-    df = pd.read_csv('../../../data/shapes/streetview_metadata_and_locs.csv')
-    
-    df = df[df['status'] == 'OK']
-    print(f'Setting up step function for {len(df)} entries...')
-
-    # We do this 10 big batches at a time, or else AWS get's mad.
-
-    tnth_of_entries = len(df) // 100
-    for super_batch in range(101):
-        print(f'Starting super batch {super_batch}.')
-        start = super_batch * tnth_of_entries
-        end = min((super_batch + 1) * tnth_of_entries, len(df))
-        mini_df = df[start : end]
-
-        # Try this out with *very* few rows. 
-        request_batches = generate_request_batches(mini_df, 10)
-
-        sfn = boto3.client('stepfunctions')
-        iam_client = boto3.client('iam')
-        
-        response = sfn.list_state_machines()
-        state_machine_arn = [sm['stateMachineArn'] for sm in response['stateMachines']
-                            if sm['name'] == STEP_FUNCTION_NAME][0]
-        
-        response = sfn.start_sync_execution(
-            stateMachineArn=state_machine_arn,
-            name=STEP_FUNCTION_NAME,
-            input=json.dumps(request_batches)
-        )
+def make_backend(args):
+    '''
+    Returns: the execution backend asked for on the command line.
+    '''
+    if args.backend == 'local':
+        return LocalBackend(max_workers=args.max_workers, output_dir=args.output_dir,
+                            endpoint_url=args.endpoint_url)
+
+    return StepFunctionsBackend(STEP_FUNCTION_NAME)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape the validated Streetview images.')
+    parser.add_argument('--backend', choices=['stepfunctions', 'local'], default='stepfunctions',
+                        help='run through Step Functions + Lambda, or a local process pool')
+    parser.add_argument('--output-dir', default=None,
+                        help='local backend only: write images here instead of to the bucket')
+    parser.add_argument('--endpoint-url', default=None,
+                        help='local backend only: S3-compatible endpoint to upload to')
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help='local backend only: batches run at once')
+    parser.add_argument('--in-flight', type=int, default=3, help='super batches running at once')
+    parser.add_argument('--lambdas-per-execution', type=int, default=10,
+                        help='lambda batches per super batch; lowered so in-flight * lambdas-per-execution '
+                             'stays within the lambda concurrency limit')
+    parser.add_argument('--target-seconds', type=float, default=120,
+                        help='how long each lambda batch should take; keep under the lambda timeout')
+    parser.add_argument('--batches', nargs='+', default=None,
+                        help='run super batch files saved with --save-batches, exactly as saved, '
+                             'instead of the validated points')
+    parser.add_argument('--save-batches', default=None,
+                        help='folder to save each super batch to, to rerun on another backend')
+    args = parser.parse_args()
+
+    if args.batches is not None:
+        superbatches = [load_batches(path) for path in args.batches]
+        requests = [req for batches in superbatches for batch in batches for req in batch['requests']]
+    else:
+        df = read_artifact('streetview_metadata_and_locs')
+        df = df[df['status'] == 'OK']
+
+        # Points sharing a panorama and heading only need one image between them
+        df = df[image_ids(df) == df['ID']]
+        requests = generate_requests(df)
+
+    print(f'Setting up {args.backend} for {len(requests)} entries...')
+
+    def save(batches):
+        n_saved = len(os.listdir(args.save_batches))
+        save_batches(batches, os.path.join(args.save_batches, f'super_batch_{n_saved:05d}.json'))
+
+    if args.save_batches is not None:
+        os.makedirs(args.save_batches, exist_ok=True)
+
+    # The local backend's worker processes are shut down however the run ends
+    with make_backend(args) as backend:
+        # Every point has already been validated by validate_points.py, so the
+        # batches are trusted and the lambdas skip their own metadata call
+        scheduler = SuperbatchScheduler(backend, PROGRESS_PATH.format(backend=args.backend),
+                                        lambdas_per_execution=args.lambdas_per_execution,
+                                        in_flight=args.in_flight, target_seconds=args.target_seconds,
+                                        max_concurrency=backend.max_concurrency)
+        if args.batches is not None:
+            # Saved batches carry their own trusted flag and sizes
+            totals = scheduler.run_saved(superbatches)
+        else:
+            totals = scheduler.run(requests, trusted=True,
+                                   on_submit=save if args.save_batches is not None else None)
+
+    print(f'Done! {dict(totals)}')
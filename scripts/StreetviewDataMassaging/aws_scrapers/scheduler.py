@@ -0,0 +1,244 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Scheduler which feeds image requests to an execution backend in
+###        super batches sized from observed throughput and the Step Functions
+###        payload limit, keeps several executions in flight, requeues failed
+###        requests, and records progress so reruns only send what's missing.
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque, Counter
+import json
+import os
+
+# Step Functions rejects execution inputs over 256KB; leave some headroom
+PAYLOAD_LIMIT = 256 * 1024
+PAYLOAD_HEADROOM = 0.9
+
+class SuperbatchScheduler:
+    '''
+    Self-tuning super batch scheduler for the image scrape.
+    '''
+
+    def __init__(self, backend, progress_path, lambdas_per_execution=10, in_flight=3,
+                 target_seconds=120, initial_batch_size=25, max_attempts=3,
+                 payload_limit=PAYLOAD_LIMIT, max_concurrency=None):
+        '''
+        Arguments:
+          backend: execution backend from backends.py.
+          progress_path (str): JSON lines file recording the outcome of every
+            finished request.
+          lambdas_per_execution (int): batches (lambda invocations) per super
+            batch; at most the state machine's MaxConcurrency. Lowered if
+            needed so no more than max_concurrency lambdas run at once.
+            Defaults to 10.
+          in_flight (int): super batches running at once. Only lowered if it
+            alone exceeds max_concurrency. Defaults to 3.
+          target_seconds (float): how long each batch should take; keep it
+            well under the lambda timeout. Defaults to 120.
+          initial_batch_size (int): requests per batch until there is a
+            throughput measurement. Defaults to 25.
+          max_attempts (int): times a request is sent before giving up on it.
+            Defaults to 3.
+          payload_limit (int): largest execution input, in bytes. Defaults to
+            PAYLOAD_LIMIT.
+          max_concurrency (int): lambdas which can run at once, e.g. the
+            reserved concurrency. Lambdas past it are throttled and fail, so
+            in_flight * lambdas_per_execution is kept under it. If None, no
+            limit. Defaults to None.
+        '''
+        if max_concurrency is not None and in_flight * lambdas_per_execution > max_concurrency:
+            # Keep the executions in flight and shrink each one instead
+            capped_in_flight = min(in_flight, max_concurrency)
+            capped_lambdas = max(1, max_concurrency // capped_in_flight)
+            print(f'{in_flight} super batches of {lambdas_per_execution} lambdas would exceed the '
+                  f'concurrency limit of {max_concurrency}; running {capped_in_flight} of '
+                  f'{capped_lambdas} lambdas at once instead.')
+            in_flight, lambdas_per_execution = capped_in_flight, capped_lambdas
+
+        self.backend = backend
+        self.progress_path = progress_path
+        self.lambdas_per_execution = lambdas_per_execution
+        self.in_flight = in_flight
+        self.target_seconds = target_seconds
+        self.batch_size = initial_batch_size
+        self.max_attempts = max_attempts
+        self.payload_limit = payload_limit
+
+        # Smoothed seconds a lambda spends per request, None until measured
+        self.seconds_per_request = None
+
+        if os.path.dirname(progress_path) != '':
+            os.makedirs(os.path.dirname(progress_path), exist_ok=True)
+
+    def finished_ids(self):
+        '''
+        Returns (set): IDs recorded as uploaded or skipped by earlier runs.
+        '''
+        if not os.path.exists(self.progress_path):
+            return set()
+
+        with open(self.progress_path) as f:
+            records = [json.loads(line) for line in f if line.strip() != '']
+
+        return {record['ID'] for record in records if record['outcome'] in ['uploaded', 'skipped']}
+
+    def run(self, requests, trusted=True, on_submit=None):
+        '''
+        Send every request not already finished, until each is uploaded,
+        skipped, or has failed max_attempts times.
+
+        Inputs:
+          requests (list of dict): lambda requests (ID, latitude, longitude,
+            heading, API_KEY).
+          trusted (bool): whether the lambdas can skip the metadata check.
+            Defaults to True.
+          on_submit (function): called with each super batch as it is sent,
+            e.g. to save it. Defaults to None.
+
+        Returns (Counter): number of requests per final outcome.
+        '''
+        finished = self.finished_ids()
+        queue = deque(req for req in requests if req['ID'] not in finished)
+        print(f'{len(finished)} images already finished, {len(queue)} to go.')
+
+        by_id = {req['ID']: req for req in queue}
+        attempts = Counter()
+        totals = Counter()
+
+        with ThreadPoolExecutor(max_workers=self.in_flight) as executor:
+            pending = {}
+            while len(queue) > 0 or len(pending) > 0:
+                while len(queue) > 0 and len(pending) < self.in_flight:
+                    batches = self.__next_superbatch(queue, trusted)
+                    if on_submit is not None:
+                        on_submit(batches)
+                    pending[executor.submit(self.__run_timed, batches)] = batches
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batches = pending.pop(future)
+                    results, seconds = future.result()
+                    if seconds is not None:
+                        self.__tune(batches, seconds)
+
+                    for point_id in results['failed']:
+                        attempts[point_id] += 1
+                        if attempts[point_id] < self.max_attempts:
+                            queue.append(by_id[point_id])
+                        else:
+                            totals['failed'] += 1
+
+                    totals['uploaded'] += len(results['uploaded'])
+                    totals['skipped'] += len(results['skipped'])
+                    self.__record(results)
+
+                    took = 'unknown time' if seconds is None else f'{seconds:.0f}s'
+                    print(f'Super batch done in {took}: {len(results["uploaded"])} uploaded, '
+                          f'{len(results["failed"])} failed, {len(queue)} queued. '
+                          f'Next batches hold {self.batch_size} requests.')
+
+        return totals
+
+    def run_saved(self, superbatches):
+        '''
+        Send super batches exactly as they were saved, e.g. to replay a run
+        on another backend. Batches are not resized or split, and failed
+        requests are not requeued. Requests already finished are left out.
+
+        Inputs:
+          superbatches (list): super batches, each a list of lambda events.
+
+        Returns (Counter): number of requests per outcome.
+        '''
+        finished = self.finished_ids()
+        totals = Counter()
+
+        with ThreadPoolExecutor(max_workers=self.in_flight) as executor:
+            futures = []
+            for batches in superbatches:
+                batches = [{**batch, 'requests':[req for req in batch['requests'] if req['ID'] not in finished]}
+                           for batch in batches]
+                batches = [batch for batch in batches if len(batch['requests']) > 0]
+                if len(batches) > 0:
+                    futures.append(executor.submit(self.__run_timed, batches))
+
+            print(f'Replaying {len(futures)} saved super batches.')
+            for future in futures:
+                results, seconds = future.result()
+                for outcome, ids in results.items():
+                    totals[outcome] += len(ids)
+                self.__record(results)
+
+                took = 'unknown time' if seconds is None else f'{seconds:.0f}s'
+                print(f'Super batch done in {took}: {len(results["uploaded"])} uploaded, '
+                      f'{len(results["failed"])} failed.')
+
+        return totals
+
+    def __next_superbatch(self, queue, trusted):
+        '''
+        Pop the next super batch of requests off the queue, split into
+        lambdas_per_execution batches.
+
+        Returns (list): lambda events.
+        '''
+        size = min(self.batch_size * self.lambdas_per_execution,
+                   self.__payload_capacity(queue[0]), len(queue))
+        reqs = [queue.popleft() for _ in range(size)]
+
+        n_batches = min(self.lambdas_per_execution, len(reqs))
+        return [{'trusted':trusted, 'requests':reqs[i::n_batches]} for i in range(n_batches)]
+
+    def __payload_capacity(self, req):
+        '''
+        Returns (int): how many requests like req fit in one execution input.
+        '''
+        # Each request is followed by ', ', and each batch wraps its requests
+        # in {"trusted": true, "requests": [...]}
+        per_request = len(json.dumps(req)) + 2
+        per_batch = len(json.dumps({'trusted':True, 'requests':[]})) + 2
+
+        usable = self.payload_limit * PAYLOAD_HEADROOM - per_batch * self.lambdas_per_execution
+        return max(1, int(usable // per_request))
+
+    def __run_timed(self, batches):
+        '''
+        Run a super batch. The backend reports how long the batches ran for,
+        so time spent queued behind other super batches doesn't skew the
+        throughput estimate. A backend error fails the whole batch.
+
+        Returns (tuple): (results, seconds taken, or None if unknown).
+        '''
+        try:
+            return self.backend.run(batches)
+        except Exception as e:
+            print(f'Super batch failed with {e}.')
+            results = {'uploaded':[], 'skipped':[],
+                       'failed':[req['ID'] for batch in batches for req in batch['requests']]}
+            return results, None
+
+    def __tune(self, batches, seconds):
+        '''
+        Update the throughput estimate from a finished super batch and resize
+        batches so each lambda runs for about target_seconds. Batches run in
+        parallel, so the super batch takes as long as its largest batch.
+        '''
+        largest = max(len(batch['requests']) for batch in batches)
+        observed = seconds / largest
+
+        if self.seconds_per_request is None:
+            self.seconds_per_request = observed
+        else:
+            self.seconds_per_request = 0.5 * self.seconds_per_request + 0.5 * observed
+
+        self.batch_size = max(1, int(self.target_seconds / self.seconds_per_request))
+
+    def __record(self, results):
+        '''
+        Append the outcome of every request in a finished super batch to the
+        progress file.
+        '''
+        with open(self.progress_path, 'a') as f:
+            for outcome, ids in results.items():
+                for point_id in ids:
+                    f.write(json.dumps({'ID':point_id, 'outcome':outcome}) + '\n')
@@ -0,0 +1,74 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Collapses validated points which snapped to the same panorama and
+###        look in a similar direction, so we only pay for one image of each.
+###        Every point keeps a pointer to the image that stands in for it.
+
+import pandas as pd
+import numpy as np
+import argparse
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import read_artifact, write_artifact
+
+HEADING_TOLERANCE = 30
+
+def dedup_panoramas(df, heading_tolerance=HEADING_TOLERANCE):
+    '''
+    Pick one image to download for every group of points sharing a panorama
+    and a heading. Headings are bucketed into heading_tolerance degree
+    sectors centered on 0 (so 355 and 5 land together), and the first point
+    in each (pano_id, sector) stands in for the rest.
+
+    Inputs:
+      df (DataFrame): validated points, with ID, pano_id, heading and status.
+      heading_tolerance (int): width of a heading sector in degrees. Set to
+        360 to keep one image per panorama. Defaults to HEADING_TOLERANCE.
+
+    Returns: pandas DataFrame of ID, pano_id, and image_id, the ID of the
+      point whose image is used for this point, for every point with imagery.
+    '''
+    df = df[(df['status'] == 'OK') & df['pano_id'].notna()]
+
+    n_sectors = max(1, int(round(360 / heading_tolerance)))
+    sector = np.floor((df['heading'].to_numpy(dtype=np.float64) + heading_tolerance / 2) / heading_tolerance)\
+        .astype(int) % n_sectors
+
+    image_id = df.groupby([df['pano_id'].to_numpy(), sector])['ID'].transform('first')
+
+    return pd.DataFrame({'ID':df['ID'].to_numpy(), 'pano_id':df['pano_id'].to_numpy(),
+                         'image_id':image_id.to_numpy()})
+
+def image_ids(metadata):
+    '''
+    Returns: pandas Series of the image each point in metadata uses: its
+      stand-in from streetview_panoramas if dedup has been run, otherwise its
+      own ID.
+    '''
+    try:
+        panoramas = read_artifact('streetview_panoramas', columns=['ID', 'image_id'])
+    except FileNotFoundError:
+        return metadata['ID'].rename('image_id')
+
+    stand_ins = panoramas.set_index('ID')['image_id']
+    return metadata['ID'].map(stand_ins).fillna(metadata['ID']).rename('image_id')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Collapse points which share a panorama before downloading images.')
+    parser.add_argument('--heading-tolerance', type=int, default=HEADING_TOLERANCE,
+                        help='width in degrees of the heading sectors treated as the same view')
+    parser.add_argument('--csv', action='store_true', help='also export the panorama index as a CSV')
+    args = parser.parse_args()
+
+    metadata = read_artifact('streetview_metadata_and_locs', columns=['ID', 'heading', 'pano_id', 'status'])
+    panoramas = dedup_panoramas(metadata, args.heading_tolerance)
+
+    n_images = panoramas['image_id'].nunique()
+    n_saved = len(panoramas) - n_images
+    print(f'{len(panoramas)} points with imagery share {panoramas["pano_id"].nunique()} panoramas.')
+    print(f'Downloading {n_images} images instead of {len(panoramas)}, '
+          f'saving {n_saved} paid image calls ({100 * n_saved / max(len(panoramas), 1):.1f}%).')
+
+    write_artifact(panoramas, 'streetview_panoramas', csv=args.csv)
@@ -5,10 +5,21 @@
 
 import pandas as pd
 import numpy as np
+import argparse
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import read_artifact, write_artifact
+from dedup_panoramas import image_ids
 
 REL_SEGMENTS = ['tree', 'grass', 'field', 'flower', 'hill']
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Make the greenery index.')
+    parser.add_argument('--csv', action='store_true', help='also export streetview_greenery.csv')
+    args = parser.parse_args()
+
     segments = pd.read_parquet('../../data/raw/streetview_segments.parquet')\
                 [REL_SEGMENTS]\
                 .reset_index()
@@ -25,15 +36,17 @@ if __name__ == "__main__":
     # keep just relevant columns
     segments = segments[['image_id', 'absolute_greenery', 'relative_greenery', 'relative_tree']]
 
-    # attach metadata
-    metadata = pd.read_csv('../../data/shapes/streetview_metadata_and_locs.csv')
+    # attach metadata -- points whose image was deduplicated away share the
+    # segments of the point standing in for them
+    metadata = read_artifact('streetview_metadata_and_locs')
+    metadata['image_id'] = image_ids(metadata)
 
     merged = metadata\
-        .merge(segments, how='inner', left_on='ID', right_on='image_id')\
+        .merge(segments, how='inner', on='image_id')\
         .drop('image_id', axis=1)
 
     # To ensure merge was clean enough
     print(f'Merged has shape {merged.shape}, segments has shape {segments.shape}, metadata has shape {metadata.shape}.')
 
-    merged.to_csv('../../data/streetview_greenery.csv', index=False)
+    write_artifact(merged, 'streetview_greenery', csv=args.csv)
 
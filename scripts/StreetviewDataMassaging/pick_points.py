@@ -1,55 +1,219 @@
 ### Author: Ashlynn Wimer
-### Last Modified: 5/16/2024
-### About: Multithreaded approach which grabs the initial points for my Streetview 
-###        data pulls.
+### Last Modified: 10/17/2026
+### About: Grabs the initial points for my Streetview data pulls by sampling
+###        uniformly (by length, in meters) along the Chicago street network,
+###        optionally keeping a minimum spacing between points.
 
 from shapely import (
-    MultiLineString, 
-    get_coordinates
+    get_coordinates,
+    line_interpolate_point,
+    length
 )
 
-from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
+from pyproj import Transformer
 import geopandas as gpd
 import pandas as pd
 import numpy as np
+import argparse
+import sys
+import os
 
-STREETS = gpd.read_file('../../data/shapes/center_line/trans.shp')\
-    .geometry\
-    .make_valid()\
-    .to_crs('EPSG:4326')
-STREETS = STREETS[~(STREETS.is_empty | STREETS.isna())]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import write_artifact
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'spatial'))
+from TractAssigner import TractAssigner
+from GeometryStore import CRS
+
+STREETS_PATH = '../../data/shapes/center_line/trans.shp'
 
 N_POINTS = 25000
 
-def grab_thousand_points(lst: list, streets: gpd.GeoDataFrame=STREETS) -> None:
+# How many times to redraw when a minimum spacing rejects too many points
+MAX_ROUNDS = 10
+
+TO_WGS84 = Transformer.from_crs(CRS, 'EPSG:4326', always_xy=True)
+
+def load_streets(path=STREETS_PATH):
     '''
-    Grab 1000 random points on the Chicago street network and append them to a list
-    of points in-place.
+    Load the street center lines, dropping empty and missing geometries.
+
+    Returns: GeoDataFrame of the streets and their attributes, in EPSG:26916
+      so that lengths are in meters.
     '''
-    rdm = np.random.default_rng()
-    loc_vals = [rdm.random() for _ in range(1000)]
-    streets = MultiLineString(streets.values)
+    streets = gpd.read_file(path)
+    streets['geometry'] = streets.geometry.make_valid()
+    streets = streets.to_crs(CRS)
 
-    pnts = streets.line_interpolate_point(loc_vals, normalized=True)
-    
-    # Append our points to the list
-    lst.append(pnts)
+    return streets[~(streets.is_empty | streets.geometry.isna())].reset_index(drop=True)
 
-if __name__ == '__main__':
+def street_tracts(streets):
+    '''
+    Returns: numpy array of the GEOID of the tract each street's midpoint is in.
+    '''
+    midpoints = get_coordinates(line_interpolate_point(streets.geometry.values, 0.5, normalized=True))
+    return TractAssigner().assign(*TO_WGS84.transform(midpoints[:, 0], midpoints[:, 1]))
+
+def draw_on_lines(lines, n, rng):
+    '''
+    Draw n points uniformly by length along a set of lines, in one
+    vectorized pass: a distance along the whole network is drawn for every
+    point, the line it lands on is found from the cumulative line lengths,
+    and the point is interpolated along that line.
+
+    Inputs:
+      lines (array of LineStrings): the lines to sample along.
+      n (int): number of points to draw.
+      rng (numpy Generator): source of randomness.
+
+    Returns: numpy array of (x, y) coordinates.
+    '''
+    lengths = length(lines)
+    ends = np.cumsum(lengths)
+
+    distances = rng.random(n) * ends[-1]
+    line_idx = np.searchsorted(ends, distances, side='right').clip(max=len(lines) - 1)
+    offsets = distances - (ends[line_idx] - lengths[line_idx])
+
+    return get_coordinates(line_interpolate_point(lines[line_idx], offsets))
+
+def spaced(xy, min_spacing):
+    '''
+    Thin points so that none are within min_spacing of each other. Points
+    are accepted greedily in order, each one only if no earlier accepted
+    point is too close, so points at the front are always kept first.
+
+    Inputs:
+      xy (array): (n, 2) array of projected coordinates.
+      min_spacing (float): minimum distance between points, in meters.
+
+    Returns: numpy boolean array of which points are kept.
+    '''
+    pairs = np.sort(cKDTree(xy).query_pairs(min_spacing, output_type='ndarray'), axis=1)
+
+    # Visiting pairs by their later point means every earlier point's fate
+    # is already decided when it is checked against
+    pairs = pairs[np.argsort(pairs[:, 1], kind='stable')]
+
+    keep = np.ones(len(xy), dtype=bool)
+    for earlier, later in pairs:
+        if keep[earlier]:
+            keep[later] = False
+
+    return keep
+
+def draw_spaced(lines, n, rng, min_spacing=None):
+    '''
+    Draw n points along a set of lines with draw_on_lines, then, if a
+    minimum spacing is given, reject points too close to an earlier one and
+    redraw until there are n points or MAX_ROUNDS draws have been made.
 
-    print(f'Grabbing {(N_POINTS // 1000) * 1000} points...')
+    Returns: numpy array of (x, y) coordinates. May hold fewer than n points
+      if the lines can't fit n points min_spacing apart.
+    '''
+    xy = draw_on_lines(lines, n, rng)
+    if min_spacing is None:
+        return xy
+
+    xy = xy[spaced(xy, min_spacing)]
+    for _ in range(MAX_ROUNDS - 1):
+        if len(xy) >= n:
+            break
+        xy = np.vstack([xy, draw_on_lines(lines, n - len(xy), rng)])
+        xy = xy[spaced(xy, min_spacing)]
+
+    if len(xy) < n:
+        print(f'Only fit {len(xy)} of {n} points {min_spacing}m apart.')
+
+    return xy[:n]
+
+def allocate(weights, n):
+    '''
+    Split n points between strata in proportion to their weights, using
+    largest remainders so the allocation adds up to exactly n.
+
+    Returns: pandas Series of points per stratum.
+    '''
+    shares = n * weights / weights.sum()
+    counts = np.floor(shares).astype(int)
+
+    leftover = n - counts.sum()
+    counts[(shares - counts).sort_values(ascending=False).index[:leftover]] += 1
+
+    return counts
+
+def sample_points(streets, n, seed=None, strata=None, allocation='proportional', min_spacing=None):
+    '''
+    Sample points along the street network. Sampling happens in meters, so
+    points are spread evenly on the ground rather than evenly in degrees.
+
+    Inputs:
+      streets (GeoDataFrame): the street network.
+      n (int): number of points to sample.
+      seed (int): seed for the random draws, for reproducible samples.
+        If None, a fresh sample every time. Defaults to None.
+      strata (str): column of streets to stratify on, e.g. 'CLASS' or
+        'GEOID'. If None, samples the whole network at once. Defaults to None.
+      allocation (str): how points are split between strata: 'proportional'
+        to street length, or 'equal'. Defaults to 'proportional'.
+      min_spacing (float): minimum distance between points in meters, so we
+        don't pay for near duplicate panoramas. Spacing is kept within each
+        stratum. If None, points may be arbitrarily close. Defaults to None.
+
+    Returns: pandas DataFrame of longitude and latitude (EPSG:4326) of each
+      point, plus the stratum each was drawn from if stratifying.
+    '''
+    assert allocation in ['proportional', 'equal'], "allocation must be 'proportional' or 'equal'."
+    rng = np.random.default_rng(seed)
+    lines = streets.geometry.values
+
+    def to_lonlat(xy):
+        return pd.DataFrame(np.column_stack(TO_WGS84.transform(xy[:, 0], xy[:, 1])),
+                            columns=['longitude', 'latitude'])
+
+    if strata is None:
+        return to_lonlat(draw_spaced(lines, n, rng, min_spacing))
+
+    groups = streets.groupby(strata).indices
+    if allocation == 'equal':
+        weights = pd.Series(1.0, index=list(groups))
+    else:
+        weights = pd.Series({stratum: length(lines[idx]).sum() for stratum, idx in groups.items()})
+
+    samples = []
+    for stratum, n_stratum in allocate(weights, n).items():
+        if n_stratum == 0:
+            continue
+
+        sample = to_lonlat(draw_spaced(lines[groups[stratum]], n_stratum, rng, min_spacing))
+        sample[strata] = stratum
+        samples.append(sample)
+
+    return pd.concat(samples, ignore_index=True)
+
+if __name__ == '__main__':
 
-    pnts = []
+    parser = argparse.ArgumentParser(description='Grab the initial points for our Streetview pulls.')
+    parser.add_argument('--n-points', type=int, default=N_POINTS, help='number of points to sample')
+    parser.add_argument('--seed', type=int, default=None, help='seed, for a reproducible sample')
+    parser.add_argument('--strata', default=None,
+                        help="street column to stratify on, e.g. CLASS, or GEOID to stratify by tract")
+    parser.add_argument('--allocation', choices=['proportional', 'equal'], default='proportional',
+                        help='split points between strata by street length, or equally')
+    parser.add_argument('--min-spacing', type=float, default=None,
+                        help='minimum distance between points, in meters')
+    parser.add_argument('--csv', action='store_true', help='also export the points as a CSV')
+    args = parser.parse_args()
 
-    with ThreadPoolExecutor(max_workers=7) as executor:
-        for i in range(N_POINTS // 1000):
-            executor.submit(grab_thousand_points, pnts)
+    streets = load_streets()
+    if args.strata == 'GEOID':
+        streets['GEOID'] = street_tracts(streets)
 
-    print('Points grabbed! Cleaning and assembling..')
+    print(f'Grabbing {args.n_points} points...')
 
-    coords = pd.DataFrame(get_coordinates(pnts), columns=['longitude', 'latitude'])
+    coords = sample_points(streets, args.n_points, args.seed, args.strata, args.allocation, args.min_spacing)
     coords['ID'] = 'I' + coords.index.astype(str)
 
-    print(f'Saving {len(coords)} points to csv..')
+    print(f'Saving {len(coords)} points..')
 
-    coords.to_csv('../../data/shapes/streetview_locations_initial.csv', index=False)
\ No newline at end of file
+    write_artifact(coords[['longitude', 'latitude', 'ID']], 'streetview_locations_initial', csv=args.csv)
@@ -2,16 +2,30 @@
 ### Date: 5/16/2024
 ### About: This script prepares the metadata location file for our scraper by
 ###        verifying image availability, generating random headings, and finding
-###        image dates.
+###        image dates and panorama IDs.
 
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import numpy as np
 import requests
+import argparse
+import hashlib
+import shutil
+import json
+import sys
 import os
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GoogleApiBuddy'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import read_artifact, write_artifact
+from ResponseCache import ResponseCache, FINAL_STATUSES
+
 METADATA_URL = 'https://maps.googleapis.com/maps/api/streetview/metadata?'
 API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY_CHICAGO')
-
+CACHE_PATH = '../../data/cache/streetview_responses.sqlite'
+CHECKPOINT_DIR = '../../data/cache/validation'
+COLUMNS = ['ID', 'longitude', 'latitude', 'heading', 'dates', 'pano_id', 'status']
 def generate_request_url(loc: tuple, heading: int) -> str:
     '''
     Generate the Streetview Metadata API request for a given location.
@@ -26,52 +40,127 @@ def generate_request_url(loc: tuple, heading: int) -> str:
     parameters = f'{size_rq}&{heading_rq}&{source_rq}&{return_error_code_rq}&{key_rq}&{loc_rq}'
 
     return f'{METADATA_URL}{parameters}'
-    
+
+def validate(point, cache, session):
+    '''
+    Check whether Google has imagery near one point.
+
+    Inputs:
+      point (tuple): (ID, longitude, latitude, heading).
+      cache (ResponseCache): cache the metadata call goes through.
+      session (requests.Session): session used on cache misses.
+
+    Returns (dict): the ID, the location the point snapped to (None if there
+      is no imagery), the heading, the image date, the panorama ID, and the
+      metadata status.
+    '''
+    point_id, lon, lat, heading = point
+    metadata = cache.fetch_json(generate_request_url((lat, lon), heading), session)
+    if metadata is None:
+        metadata = {'status':'REQUEST_FAILED'}
+
+    if metadata['status'] != 'OK':
+        return {'ID':point_id, 'longitude':None, 'latitude':None, 'heading':heading,
+                'dates':None, 'pano_id':None, 'status':metadata['status']}
+
+    return {'ID':point_id, 'longitude':metadata['location']['lng'],
+            'latitude':metadata['location']['lat'], 'heading':heading,
+            'dates':metadata['date'], 'pano_id':metadata['pano_id'],
+            'status':metadata['status']}
+
+def prepare_checkpoint(checkpoint_dir, df, seed):
+    '''
+    Make sure the checkpoint folder belongs to these exact points and seed,
+    throwing it away if not.
+
+    Returns (set): the IDs already given a final status in the checkpoint.
+    '''
+    points_hash = hashlib.sha256(
+        pd.util.hash_pandas_object(df[['ID', 'longitude', 'latitude']], index=False).values.tobytes()
+    ).hexdigest()
+    manifest = {'points':points_hash, 'seed':seed, 'columns':COLUMNS}
+    manifest_path = os.path.join(checkpoint_dir, 'manifest.json')
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                done = read_checkpoint(checkpoint_dir)
+                print(f'Resuming: {len(done)} points already validated.')
+                return set(done['ID'])
+        print('Points, seed or recorded columns changed since the last checkpoint, starting over.')
+        shutil.rmtree(checkpoint_dir)
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+    return set()
+
+def read_checkpoint(checkpoint_dir):
+    '''
+    Returns: pandas DataFrame of every point with a final status in the
+      checkpoint.
+    '''
+    chunks = sorted(f for f in os.listdir(checkpoint_dir) if f.endswith('.parquet'))
+    if len(chunks) == 0:
+        return pd.DataFrame(columns=COLUMNS)
+
+    return pd.concat([pd.read_parquet(os.path.join(checkpoint_dir, chunk)) for chunk in chunks],
+                     ignore_index=True)
+
 if __name__ == "__main__":
-    
-    df = pd.read_csv('../../data/shapes/streetview_locations_initial.csv')
-
-    print("Going through the initial dataframe for valid locations.")
-    # This is maybe a slightly messay approach, but it works.
-    lons, lats, ids, status, headings, dates = [], [], [], [], [], []
-    for i, row in df.iterrows():
-
-        if i % 100 == 0:
-            print(f'At row {i}.')
-
-        heading = np.random.randint(0, 360)
-        locs = (row['latitude'], row['longitude'])    
-        metadata = requests.get(generate_request_url(locs, heading)).json()
-
-        if metadata['status'] != 'OK':
-            headings.append(heading)
-            status.append(metadata['status'])
-            dates.append('NA')
-            lons.append('NA')
-            lats.append('NA')
-            ids.append(row['ID'])
-            continue
-        
-        headings.append(heading)
-        status.append(metadata['status'])
-        dates.append(metadata['date'])
-        ids.append(row['ID'])
-        lons.append(metadata['location']['lng'])
-        lats.append(metadata['location']['lat'])
-
-    new_df = pd.DataFrame(
-        {
-            'ID':ids,
-            'longitude':lons,
-            'latitude':lats,
-            'heading':headings,
-            'dates':dates,
-            'status':status            
-        }
-    )
-    
+
+    parser = argparse.ArgumentParser(description='Validate the initial Streetview points.')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random headings')
+    parser.add_argument('--max-workers', type=int, default=8, help='metadata requests in flight at once')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='points validated per checkpoint chunk')
+    parser.add_argument('--csv', action='store_true', help='also export the validated points as a CSV')
+    args = parser.parse_args()
+
+    df = read_artifact('streetview_locations_initial')
+    cache = ResponseCache(CACHE_PATH)
+
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=args.max_workers))
+
+    # Headings are drawn for every point up front, so a point gets the same
+    # heading however many times the run is restarted
+    df['heading'] = np.random.default_rng(args.seed).integers(0, 360, len(df))
+
+    done = prepare_checkpoint(CHECKPOINT_DIR, df, args.seed)
+    todo = df[~df['ID'].isin(done)]
+    first_chunk = len([f for f in os.listdir(CHECKPOINT_DIR) if f.endswith('.parquet')])
+
+    print(f"Going through {len(todo)} points for valid locations.")
+    pending = []
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        for i, start in enumerate(range(0, len(todo), args.chunk_size)):
+            chunk = todo.iloc[start:start + args.chunk_size]
+            points = chunk[['ID', 'longitude', 'latitude', 'heading']].itertuples(index=False, name=None)
+
+            results = pd.DataFrame(list(executor.map(lambda point: validate(point, cache, session), points)))
+            # Anything without a final status (quota, request failures, ...)
+            # is left out of the checkpoint so a rerun retries it
+            final = results['status'].isin(FINAL_STATUSES)
+            pending.append(results[~final])
+
+            path = os.path.join(CHECKPOINT_DIR, f'chunk_{first_chunk + i:05d}.parquet')
+            results[final].to_parquet(f'{path}.tmp', index=False)
+            os.replace(f'{path}.tmp', path)
+
+            print(f'At point {start + len(chunk)} of {len(todo)}.')
+
+    pending = pd.concat(pending, ignore_index=True) if len(pending) > 0 else pd.DataFrame(columns=COLUMNS)
+    if len(pending) > 0:
+        print(f'{len(pending)} points got no final status; rerun to retry them.')
+
+    # Put the points back in their original order
+    new_df = pd.concat([read_checkpoint(CHECKPOINT_DIR), pending], ignore_index=True)\
+        .set_index('ID')\
+        .loc[df['ID']]\
+        .reset_index()
+
     print('Saving new_df')
     print(f'As a useful statistic, have some value counts:\n{new_df.status.value_counts()}')
 
-    new_df.to_csv('../../data/shapes/streetview_metadata_and_locs.csv', index=False)
-
+    write_artifact(new_df, 'streetview_metadata_and_locs', csv=args.csv)
@@ -1,6 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import requests
+import pyarrow.dataset as ds
+import pyarrow as pa
 import pandas as pd
-import ast
+import hashlib
+import json
+import time
+import os
 
 BASE_URL = 'https://api.census.gov/data'
 VALID_GEOGRAPHIES = ['us', 'state', 'county', 'tract']
@@ -12,18 +19,54 @@ STATE_FIPS = ['01', '02', '04', '05', '06', '08', '09', '10', '11',
               '50', '51', '53', '54', '55', '56']
 ACCEPTED_SURVEYS = ['acs5', 'acs1']
 
+# The API refuses requests for more than 50 variables in one get=
+MAX_VARIABLES_PER_CALL = 50
+
+# Geography columns that make up the GEOID, in order
+GEOID_PARTS = ['us', 'state', 'county', 'tract']
+
+
+class CensusCacheMiss(LookupError):
+    '''
+    Raised in offline mode when a request is not in the local cache.
+    '''
+
 
 class CensusFriendo:
     '''
     Class that helps with Census data pulls.
     '''
 
-    def __init__(self, API_KEY):
+    def __init__(self, API_KEY, max_workers=8, max_retries=3, backoff=1,
+                 cache_dir=None, offline=False):
         '''
         make a census friendo +
         set your secret password (api key)
+
+        max_workers (int): how many requests to have in flight at once.
+          Defaults to 8.
+        max_retries (int): how many times to retry a failed request.
+          Defaults to 3.
+        backoff (float): seconds to wait before the first retry; doubles
+          after each failed attempt. Defaults to 1.
+        cache_dir (str): folder to keep Parquet copies of every response in.
+          Published ACS vintages never change, so cached responses are served
+          without touching the network. If None, nothing is cached.
+          Defaults to None.
+        offline (bool): if True, never touch the network, and raise
+          CensusCacheMiss for anything not in cache_dir. Defaults to False.
         '''
+        assert not (offline and cache_dir is None), 'Offline mode needs a cache_dir to read from.'
+
         self.API_KEY = API_KEY
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache_dir = cache_dir
+        self.offline = offline
+
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
 
     def __generate_geography(self, geography, state):
         '''
@@ -45,24 +88,31 @@ class CensusFriendo:
 
         return rv
 
-    def __api_return_to_df(self, api_return, name):
+    def __api_return_to_df(self, api_return, names):
         '''
         Takes the returned value from an API call and turns it into a pandas
         dataframe.
         
         Inputs: 
             api_return (api return value)
-            name (str): name of the table
+            names (dict): maps the requested tables to their column names
 
         Returns: pandas dataframe
         '''
-        lst = ast.literal_eval(api_return.text.strip())
-        lst[0][0] = name
+        rows = api_return.json()
+        header = [names.get(col, col) for col in rows[0]]
 
-        df = pd.DataFrame(lst[1:], columns=lst[0])
-        
-        df['GEOID'] = df.get('us', '') + df.get('state', '')\
-            + df.get('county', '') + df.get('tract', '')
+        # Transpose into columns once, rather than building an object frame
+        # row by row and converting it afterwards.
+        columns = zip(*rows[1:]) if len(rows) > 1 else [[] for _ in header]
+        df = pd.DataFrame({name:self.__to_typed_column(name, values, names)
+                           for name, values in zip(header, columns)})
+
+        # GEOID is a fixed-width string key, so keep the leading zeros
+        df['GEOID'] = ''
+        for part in GEOID_PARTS:
+            if part in df.columns:
+                df['GEOID'] = df['GEOID'] + df[part]
         
         df = df.drop(['state'],  errors='ignore', axis=1)
         df = df.drop(['county'], errors='ignore', axis=1)
@@ -70,28 +120,112 @@ class CensusFriendo:
 
         return df
 
-    def __make_api_url(self, year, survey, table, geography, state):
+    def __to_typed_column(self, name, values, names):
+        '''
+        Turn the raw values for one column into a typed pandas Series.
+        Requested variables become numeric (nulls become NaN), unless they
+        hold text (e.g. NAME); geography columns stay strings.
+
+        Returns: pandas Series
         '''
-        Given the year, survey, table, and geography,
+        values = pd.Series(values, dtype=object)
+        if name not in names.values():
+            return values.astype(str)
+
+        try:
+            return pd.to_numeric(values).astype('float64')
+        except (ValueError, TypeError):
+            return values
+
+    def __make_api_url(self, year, survey, tables, geography, state):
+        '''
+        Given the year, survey, list of tables, and geography,
         make a valid API request URL
         '''
         geography = self.__generate_geography(geography, state)
 
-        return f'{BASE_URL}/{year}/acs/{survey}?get={table}&{geography}&key={self.API_KEY}'
+        return f'{BASE_URL}/{year}/acs/{survey}?get={",".join(tables)}&{geography}&key={self.API_KEY}'
+
+    def __get_batch(self, year, survey, batch, geography, state):
+        '''
+        Request every table in batch with a single API call, retrying with
+        exponential backoff if the call fails.
+
+        Inputs:
+          batch (dict): maps at most MAX_VARIABLES_PER_CALL table names to
+            their desired column names.
 
-    def __add_table_to_df(self, df, year, survey, table_tuple, geography, state):
+        Returns: pandas DataFrame of the batch, indexed by GEOID.
         '''
-        Given the request parameters, return an updated version of the DataFrame
-        with the results of the given request.
+        cache_path = self.__cache_path(year, survey, list(batch), geography, state)
+        if cache_path is not None and os.path.exists(cache_path):
+            return pd.read_parquet(cache_path).rename(columns=batch)
+
+        if self.offline:
+            raise CensusCacheMiss(f'No cached {survey} {year} {geography} data for state {state!r} with variables {list(batch)}.')
+
+        url = self.__make_api_url(year, survey, list(batch), geography, state)
+
+        wait = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(url)
+                response.raise_for_status()
+                # Cache under the raw variable names, since the column names
+                # are up to each caller
+                df = self.__api_return_to_df(response, {table:table for table in batch}).set_index('GEOID')
+                break
+            except (requests.RequestException, ValueError) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f'Census request for {year} state {state} failed with {e}, retrying in {wait}s.')
+                time.sleep(wait)
+                wait *= 2
+
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            df.to_parquet(f'{cache_path}.tmp')
+            os.replace(f'{cache_path}.tmp', cache_path)
+
+        return df.rename(columns=batch)
+
+    def __cache_path(self, year, survey, tables, geography, state):
         '''
+        Where the response for a request lives in the cache, keyed on
+        (year, survey, variables, geography, state).
+
+        Returns (str): path of the Parquet file, or None if not caching.
+        '''
+        if self.cache_dir is None:
+            return None
+
+        key = json.dumps([int(year), survey, sorted(tables), geography.lower(), state])
+        digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+
+        return os.path.join(self.cache_dir, str(year), survey,
+                            f'{geography.lower()}_{state or "all"}_{digest}.parquet')
+
+    def __make_batches(self, tables):
+        '''
+        Pack the tables into as few calls as the API allows.
+
+        Returns: list of dicts mapping table names to column names.
+        '''
+        items = list(tables.items())
+        return [dict(items[i:i + MAX_VARIABLES_PER_CALL])
+                for i in range(0, len(items), MAX_VARIABLES_PER_CALL)]
+
+    def __combine_batches(self, dfs):
+        '''
+        Line up the GEOID indexed frames from every batch in one go.
+
+        Returns: pandas DataFrame with a GEOID column.
+        '''
+        # Geography columns like 'us' come back with every batch
+        dfs = [dfs[0]] + [df.drop(dfs[0].columns, errors='ignore', axis=1) for df in dfs[1:]]
+
+        return pd.concat(dfs, axis=1, join='outer').reset_index()
 
-        url = self.__make_api_url(year, survey, table_tuple[0], geography, state)
-        response = requests.get(url)            
-        
-        if df is None: return self.__api_return_to_df(response, table_tuple[1])
-        
-        return pd.DataFrame.merge(df, self.__api_return_to_df(response, table_tuple[1]), on='GEOID', how='outer')
-        
     def get_acs(self, tables, survey="acs5", year=2022, geography='county', state=''):
         '''
         Get ACS 5-Year estimates data using the Census API 
@@ -117,13 +251,94 @@ class CensusFriendo:
         if type(tables) == list: tables = {table:table for table in tables}
         if type(tables) == str: tables = {tables:tables}
 
-        # Pull all requested tables
-        rdf = None
-        for table_tuple in tables.items():
-            rdf = self.__add_table_to_df(rdf, year, survey, table_tuple, geography, state)
+        # Pack the tables into as few calls as the API allows, run the calls
+        # concurrently, then line everything up on GEOID in one go.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            dfs = list(executor.map(
+                lambda batch: self.__get_batch(year, survey, batch, geography, state),
+                self.__make_batches(tables)
+            ))
+
+        return self.__combine_batches(dfs)
+
+    def get_acs_many(self, tables, states=STATE_FIPS, years=[2022], survey='acs5',
+                     geography='tract', path=None):
+        '''
+        Get ACS estimates for every combination of states and years. Each
+        state x year x variable batch is its own unit of work, and at most
+        max_workers units run at once.
+
+        Inputs:
+          tables (str, list of str, or dict): as in get_acs.
+          states (list of str): state fips to pull. Defaults to every state.
+          years (list of int): years of estimates to pull. Defaults to [2022].
+          survey (str): either "acs5" or "acs1", defaults to "acs5"
+          geography (str): geographic scale to grab values at (defaults to 'tract')
+          path (str): if given, the results are also written to a Parquet
+            dataset at path, partitioned by state and year. Partitions being
+            rewritten replace whatever was there before. Defaults to None.
+
+        Returns: pandas DataFrame of every pull, with 'state' and 'year' columns.
+        '''
+        assert survey in ACCEPTED_SURVEYS, 'This function only supports 1- and 5-year estimates.'
+        assert all(state in STATE_FIPS for state in states), 'Must use one of 50 states.'
+
+        assert type(tables) in [list, str, dict]
+        if type(tables) == list: tables = {table:table for table in tables}
+        if type(tables) == str: tables = {tables:tables}
+
+        batches = self.__make_batches(tables)
+        units = [(state, year, batch) for state in states for year in years for batch in batches]
+        print(f'Pulling {len(units)} work units for {len(states)} states and {len(years)} years.')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            dfs = list(executor.map(
+                lambda unit: self.__get_batch(unit[1], survey, unit[2], geography, unit[0]),
+                units
+            ))
+
+        # Units come back in order, so each state x year is a run of len(batches)
+        partitions = []
+        for i in range(0, len(units), len(batches)):
+            state, year, _ = units[i]
+            df = self.__combine_batches(dfs[i:i + len(batches)])
+            df['state'] = state
+            df['year'] = year
+            partitions.append(df)
+
+        rdf = pd.concat(partitions, ignore_index=True)
+
+        if path is not None:
+            rdf.to_parquet(path, partition_cols=['state', 'year'],
+                           existing_data_behavior='delete_matching')
 
         return rdf
 
+    @staticmethod
+    def read_acs_many(path, states=None, years=None, columns=None):
+        '''
+        Read back a dataset written by get_acs_many, touching only the
+        requested partitions and columns.
+
+        Inputs:
+          path (str): location of the Parquet dataset.
+          states (list of str): state fips to read. If None, reads all.
+          years (list of int): years to read. If None, reads all.
+          columns (list of str): columns to read. If None, reads all.
+
+        Returns: pandas DataFrame
+        '''
+        filters = []
+        if states is not None: filters.append(('state', 'in', list(states)))
+        if years is not None: filters.append(('year', 'in', [int(year) for year in years]))
+
+        # Left to itself, pyarrow would read the state partitions as integers
+        # and lose the leading zero
+        partitioning = ds.partitioning(pa.schema([('state', pa.string()), ('year', pa.int64())]), flavor='hive')
+
+        return pd.read_parquet(path, columns=columns, filters=filters or None,
+                               partitioning=partitioning)
+
     def get_accepted_surveys():
         '''
         Returns a list of accepted surveys.
@@ -3,12 +3,19 @@
 ### About: This script pulls Census data for Cook County,
 ###        used in the opioid risk environment project.
 import CensusFriendo
-import geopandas as gpd
 import pandas as pd
-import numpy as np
-import pygris
+import argparse
+import sys
 import os
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'spatial'))
+from GeometryStore import GeometryStore
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import write_artifact
+
+parser = argparse.ArgumentParser(description='Pull Census data for Cook County.')
+parser.add_argument('--csv', action='store_true', help='also export censusdata.csv')
+args = parser.parse_args()
 
 tables = {
 "B06009_001E":"TotalEducation",
@@ -54,12 +61,17 @@ tables = {
 "B28002_013E":"NoInternetAccess"
 }
 
-cf = CensusFriendo.CensusFriendo(API_KEY=os.environ['CENSUS_API_KEY'])
+# ACS vintages never change, so responses are cached locally. Set
+# CENSUS_OFFLINE=1 to rerun purely from the cache; only then can the API
+# key be left unset.
+offline = os.environ.get('CENSUS_OFFLINE') == '1'
+cf = CensusFriendo.CensusFriendo(API_KEY=os.environ.get('CENSUS_API_KEY') if offline else os.environ['CENSUS_API_KEY'],
+                                 cache_dir='../../data/cache/census',
+                                 offline=offline)
 
+# Values come back as float64 columns with GEOID as a string key
 df = cf.get_acs(tables, survey='acs5', year=2022, geography='tract', state='17')
 
-df = df.astype(np.float64)
-
 # What percent of the population has *at most* a high school degree?
 df['MHSdP']  = 100 * (df['HighSchoolGrad'] + df['LessThanHighSchoolGrad']) / df['TotalEducation']
 
@@ -89,23 +101,10 @@ df['NoIntP'] = 100 * df['NoInternetAccess'] / df['InternetUniverse']
 df = df[['GEOID', 'TotalPopulation', 'WhiteP', 'BlackP', 'AsianP', 'HispP', '18to24P', 'Ovr65P', 'MHSdP', 'MedInc', 'HighRiskJobP', 'Unemployment', 'PovP', 'NoIntP']]
 
 # Subset spatially
-tracts = pygris.tracts(cb=True, county='cook', state='il')[['GEOID', 'geometry']].to_crs("EPSG:26916")
-chicago_boundaries = gpd.read_file('../../data/shapes/chicago_boundaries.geojson').to_crs('EPSG:26916')
-relevant_geoids = gpd\
-    .sjoin( 
-        chicago_boundaries.to_crs('EPSG:26916'),
-        gpd.GeoDataFrame(
-            tracts.drop('geometry', axis=1), 
-            geometry=tracts.centroid, 
-            crs='EPSG:26916'
-        ),
-        predicate='contains'
-        )['GEOID']
-
-df['GEOID'] = df.GEOID.astype(str).apply(lambda x: x.split('.')[0])
+relevant_geoids = GeometryStore().chicago_geoids()
 
 df = df[df['GEOID'].isin(relevant_geoids)]
 
 print(df.shape)
 
-df.to_csv('../../data/censusdata.csv', index=False)
+write_artifact(df, 'censusdata', csv=args.csv)
@@ -0,0 +1,183 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Partitioned Parquet store which the portal scripts upsert new rows
+###        into, along with the high-water mark of what has been pulled so far.
+
+import pandas as pd
+import shutil
+import json
+import os
+
+class IncrementalStore:
+    '''
+    Month-partitioned Parquet store of cleaned portal rows, keyed on a
+    unique id column and tracking a timestamp high-water mark.
+    '''
+
+    def __init__(self, path, key, timestamp, partition_by=None):
+        '''
+        Arguments:
+          path (str): folder holding the store.
+          key (str): column uniquely identifying a row, e.g. 'sr_number'.
+          timestamp (str): column the high-water mark is taken over. This
+            should be when the portal last changed the row (e.g.
+            'last_modified_date'), so late edits are picked up.
+          partition_by (str): column rows are partitioned by month on, e.g.
+            'created_date'. If None, uses timestamp. Defaults to None.
+        '''
+        self.path = path
+        self.key = key
+        self.timestamp = timestamp
+        self.partition_by = partition_by or timestamp
+        self.manifest_path = os.path.join(path, '_high_water_mark.json')
+
+        # Latest timestamp upserted since the mark was last advanced
+        self.pending_mark = None
+
+        # Keys upserted since clear(), or None if the store wasn't cleared.
+        # After a clear only these can have a copy in another partition.
+        self.written = None
+
+    def high_water_mark(self):
+        '''
+        Returns (str): the latest timestamp in the store, formatted as a SoQL
+          floating timestamp, or None if the store is empty.
+        '''
+        if not os.path.exists(self.manifest_path):
+            return None
+
+        with open(self.manifest_path) as f:
+            return json.load(f)['high_water_mark']
+
+    def since_clause(self):
+        '''
+        Returns (str): a SoQL condition selecting rows at or after the high-water
+          mark, or None if the store is empty. Rows exactly at the mark are
+          pulled again and deduplicated by upsert().
+        '''
+        mark = self.high_water_mark()
+        if mark is None:
+            return None
+
+        return f'{self.timestamp} >= "{mark}" :: floating_timestamp'
+
+    def upsert(self, df):
+        '''
+        Insert new rows into the store, replacing any stored rows with the
+        same key. The high-water mark is not moved until advance_mark() is
+        called, so a pull split over several upserts can't leave the mark
+        past rows it never stored. Only the month
+        partitions the new rows fall in, and any other partition holding an
+        old copy of one of them, are rewritten. Rows with no partition_by
+        value go in a month=unknown partition, rather than being dropped.
+
+        Returns: None
+        '''
+        if len(df) == 0:
+            return
+
+        times = pd.to_datetime(df[self.timestamp])
+        months = pd.to_datetime(df[self.partition_by]).dt.strftime('%Y-%m')
+        if months.isna().any():
+            print(f'{months.isna().sum()} rows have no {self.partition_by}, storing them under month=unknown.')
+            months = months.fillna('unknown')
+
+        # A row whose partition column was edited has an old copy elsewhere
+        # Right after a clear, nothing stored predates this run, so other
+        # partitions only need checking for keys this run already wrote
+        if self.written is None:
+            check_partitions = self.__partitions()
+        else:
+            check_partitions = self.__partitions() if df[self.key].isin(self.written).any() else []
+            self.written.update(df[self.key])
+
+        new_months = set(months)
+        for partition in check_partitions:
+            if partition[len('month='):] in new_months:
+                continue
+            part_file = os.path.join(self.path, partition, 'part.parquet')
+            stale = pd.read_parquet(part_file, columns=[self.key])[self.key].isin(df[self.key])
+            if stale.any():
+                kept = pd.read_parquet(part_file)[~stale.to_numpy()]
+                kept.to_parquet(f'{part_file}.tmp', index=False)
+                os.replace(f'{part_file}.tmp', part_file)
+
+        for month, new_rows in df.groupby(months):
+            partition = os.path.join(self.path, f'month={month}')
+            part_file = os.path.join(partition, 'part.parquet')
+
+            if os.path.exists(part_file):
+                new_rows = pd.concat([pd.read_parquet(part_file), new_rows], ignore_index=True)
+            new_rows = new_rows.drop_duplicates(self.key, keep='last')
+
+            os.makedirs(partition, exist_ok=True)
+            new_rows.to_parquet(f'{part_file}.tmp', index=False)
+            os.replace(f'{part_file}.tmp', part_file)
+
+        # Rows with no timestamp can't move the mark
+        if pd.isna(times.max()):
+            return
+
+        mark = times.max().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+        if self.pending_mark is None or mark > self.pending_mark:
+            self.pending_mark = mark
+
+    def advance_mark(self):
+        '''
+        Move the high-water mark up to the latest timestamp upserted so far.
+        Call this once every page of a pull is in the store: pages are not in
+        timestamp order, so advancing after each one could skip rows from
+        pages that were never stored.
+
+        Returns: None
+        '''
+        if self.pending_mark is None:
+            return
+
+        mark = self.pending_mark
+        old_mark = self.high_water_mark()
+        if old_mark is not None and old_mark > mark:
+            mark = old_mark
+
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump({'key':self.key, 'timestamp':self.timestamp,
+                       'partition_by':self.partition_by, 'high_water_mark':mark}, f)
+        self.pending_mark = None
+
+    def read(self, columns=None):
+        '''
+        Read the whole store back.
+
+        Returns: pandas DataFrame of every stored row.
+        '''
+        return pd.concat(list(self.iter_partitions(columns)), ignore_index=True)
+
+    def iter_partitions(self, columns=None):
+        '''
+        Read the store back one month partition at a time, e.g. to write it
+        out without holding every month in memory.
+
+        Yields: pandas DataFrame of each partition.
+        '''
+        for partition in self.__partitions():
+            yield pd.read_parquet(os.path.join(self.path, partition, 'part.parquet'), columns=columns)
+
+    def clear(self):
+        '''
+        Throw the store away, e.g. before a full refresh.
+
+        Returns: None
+        '''
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        self.written = set()
+
+    def __partitions(self):
+        '''
+        Returns (list of str): the month partition folders in the store.
+        '''
+        if not os.path.exists(self.path):
+            return []
+
+        return sorted(partition for partition in os.listdir(self.path) if partition.startswith('month='))
@@ -0,0 +1,187 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Helper class for paging through Chicago Data Portal (Socrata)
+###        datasets. Pages are fetched concurrently with retries, and finished
+###        pages are checkpointed to disk so interrupted pulls can resume.
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from io import StringIO
+import pandas as pd
+import requests
+import shutil
+import json
+import time
+import os
+
+BASE_URL = 'https://data.cityofchicago.org/resource'
+
+class SocrataFriendo:
+    '''
+    Class that helps with paginated Socrata pulls.
+    '''
+
+    def __init__(self, dataset, select, where=None, order=None, page_size=50000,
+                 max_workers=4, max_retries=3, backoff=1, checkpoint_dir=None):
+        '''
+        Set up a pull of one SoQL query.
+
+        Arguments:
+          dataset (str): the dataset identifier, e.g. 'v6vf-nfxy'.
+          select (list of str): columns to pull.
+          where (str): SoQL WHERE clause, without the WHERE. Defaults to None.
+          order (str): SoQL ORDER BY clause, without the ORDER BY. Pages are
+            only stable if this sorts on a unique column. Defaults to None.
+          page_size (int): rows per request. Defaults to 50000.
+          max_workers (int): pages to have in flight at once. Defaults to 4.
+          max_retries (int): times to retry a failed page. Defaults to 3.
+          backoff (float): seconds before the first retry; doubles after each
+            failed attempt. Defaults to 1.
+          checkpoint_dir (str): folder to write finished pages to. If given,
+            pages already in the folder are not fetched again. Defaults to None.
+        '''
+        assert page_size > 0, 'page_size must be positive.'
+
+        self.dataset = dataset
+        self.select = select
+        self.where = where
+        self.order = order
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.checkpoint_dir = checkpoint_dir
+
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
+    def count(self):
+        '''
+        Ask the portal how many rows the query matches.
+
+        Returns (int): the number of rows.
+        '''
+        query = 'SELECT count(*) AS n'
+        if self.where is not None:
+            query += f' WHERE {self.where}'
+
+        return int(self.__request(query)['n'].iloc[0])
+
+    def get(self):
+        '''
+        Pull every row of the query.
+
+        Returns: pandas DataFrame of the whole query, in query order.
+        '''
+        pages = list(self.iter_pages())
+        if len(pages) == 0:
+            return pd.DataFrame(columns=self.select)
+
+        return pd.concat(pages, ignore_index=True)
+
+    def iter_pages(self):
+        '''
+        Pull every page of the query, fetching (or loading checkpointed)
+        pages concurrently but yielding them in order. At most max_workers
+        pages are requested ahead of the one being yielded, so a slow
+        consumer doesn't pile finished pages up in memory.
+
+        Yields: pandas DataFrame of each page.
+        '''
+        n_rows = self.count()
+        n_pages = -(-n_rows // self.page_size)
+        print(f'{n_rows} rows to grab in {n_pages} pages of {self.page_size}.')
+
+        self.__prepare_checkpoint(n_rows)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            window = deque()
+            for page in range(n_pages):
+                if len(window) == self.max_workers:
+                    yield window.popleft().result()
+                window.append(executor.submit(self.__get_page, page))
+
+            while len(window) > 0:
+                yield window.popleft().result()
+
+    def __get_page(self, page):
+        '''
+        Load a page from the checkpoint, or fetch and checkpoint it.
+
+        Returns: pandas DataFrame of the page.
+        '''
+        path = self.__page_path(page)
+        if path is not None and os.path.exists(path):
+            return pd.read_parquet(path)
+
+        query = f'SELECT {", ".join(self.select)}'
+        if self.where is not None:
+            query += f' WHERE {self.where}'
+        if self.order is not None:
+            query += f' ORDER BY {self.order}'
+        query += f' LIMIT {self.page_size} OFFSET {page * self.page_size}'
+
+        df = self.__request(query)
+
+        if path is not None:
+            df.to_parquet(f'{path}.tmp', index=False)
+            os.replace(f'{path}.tmp', path)
+
+        return df
+
+    def __request(self, query):
+        '''
+        Run one SoQL query, retrying with exponential backoff.
+
+        Returns: pandas DataFrame of the response.
+        '''
+        url = f'{BASE_URL}/{self.dataset}.csv?$query={quote(query)}'
+
+        wait = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self.session.get(url)
+                resp.raise_for_status()
+                return pd.read_csv(StringIO(resp.text))
+            except (requests.RequestException, pd.errors.ParserError) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f'Request failed with {e}, retrying in {wait}s.')
+                time.sleep(wait)
+                wait *= 2
+
+    def __prepare_checkpoint(self, n_rows):
+        '''
+        Make sure the checkpoint folder belongs to this exact query. If the
+        query (or the number of rows it matches) changed, the old pages no
+        longer line up, so they are thrown away.
+        '''
+        if self.checkpoint_dir is None:
+            return
+
+        manifest = {'dataset':self.dataset, 'select':self.select, 'where':self.where,
+                    'order':self.order, 'page_size':self.page_size, 'n_rows':n_rows}
+        manifest_path = os.path.join(self.checkpoint_dir, 'manifest.json')
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                if json.load(f) == manifest:
+                    print('Resuming from checkpointed pages.')
+                    return
+            print('Query changed since the last checkpoint, starting over.')
+            shutil.rmtree(self.checkpoint_dir)
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+    def __page_path(self, page):
+        '''
+        Returns (str): where a page is checkpointed, or None if not checkpointing.
+        '''
+        if self.checkpoint_dir is None:
+            return None
+
+        return os.path.join(self.checkpoint_dir, f'page_{page:05d}.parquet')
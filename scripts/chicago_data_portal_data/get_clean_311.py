@@ -2,59 +2,102 @@
 ### Date: 5/2/2024
 ### About: Script used to acquire and clean 2023 311 data.
 
-from concurrent.futures import ThreadPoolExecutor
+from IncrementalStore import IncrementalStore
+from SocrataFriendo import SocrataFriendo
 import pandas as pd
-import geopandas as gpd
+import argparse
+import shutil
 import json
-import pygris
+import sys
+import os
 
-URL = "https://data.cityofchicago.org/resource/v6vf-nfxy.csv?$query=SELECT%0A%20%20%60sr_number%60%2C%0A%20%20%60sr_type%60%2C%0A%20%20%60sr_short_code%60%2C%0A%20%20%60created_date%60%2C%0A%20%20%60duplicate%60%2C%0A%20%20%60community_area%60%2C%0A%20%20%60latitude%60%2C%0A%20%20%60longitude%60%0AWHERE%0A%20%20%60created_date%60%0A%20%20%20%20BETWEEN%20%222023-01-01T00%3A00%3A00%22%20%3A%3A%20floating_timestamp%0A%20%20%20%20AND%20%222023-12-31T23%3A59%3A59%22%20%3A%3A%20floating_timestamp%0AORDER%20BY%20%60sr_number%60%20DESC%20NULL%20FIRST"
-pds = []
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'spatial'))
+from TractAssigner import TractAssigner
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import write_artifact_parts
 
-def grab_thousand_311s(offset=0, URL=URL):
+DATASET = 'v6vf-nfxy'
+SELECT = ['sr_number', 'sr_type', 'sr_short_code', 'created_date', 'last_modified_date',
+          'duplicate', 'community_area', 'latitude', 'longitude']
+WHERE = ('created_date BETWEEN "2023-01-01T00:00:00" :: floating_timestamp '
+         'AND "2023-12-31T23:59:59" :: floating_timestamp')
+CHECKPOINT_DIR = '../../data/cache/portal/311_2023'
+STORE_DIR = '../../data/portal_store/311_2023'
+
+parser = argparse.ArgumentParser(description='Acquire and clean 2023 311 data.')
+parser.add_argument('--incremental', action='store_true',
+                    help='only pull requests created or modified since the last run and upsert them into the store')
+parser.add_argument('--csv', action='store_true', help='also export 311reqs.csv')
+args = parser.parse_args()
+
+# Requests keep changing after they're opened, so the mark follows
+# last_modified_date rather than created_date
+store = IncrementalStore(STORE_DIR, key='sr_number', timestamp='last_modified_date',
+                         partition_by='created_date')
+where = WHERE
+if args.incremental and store.high_water_mark() is not None:
+    print(f'Incremental run: grabbing requests modified since {store.high_water_mark()}.')
+    where = f'({WHERE}) AND {store.since_clause()}'
+    checkpoint_dir = CHECKPOINT_DIR + '_delta'
+else:
+    print('Full run: the store will be rebuilt from scratch.')
+    store.clear()
+    checkpoint_dir = CHECKPOINT_DIR
+
+def clean_chunk(df, seen, classes, assigner):
     '''
-    Grab 1000 rows of 311 requests from the Chicago API and attach
-    it to a global (or inputted!) list.
+    Clean one page of 311 requests: drop requests already seen in an
+    earlier page, duplicates and 311IOC calls, classify the rest, and
+    attach tracts. seen is updated in-place with this page's sr_numbers.
+
+    Returns: pandas DataFrame of the cleaned page.
     '''
-    data = pd.read_csv(URL+f'%20OFFSET%20{offset*1000}')
-    pds.append(data)
+    # Deduplicate before filtering, so a request is kept exactly when its
+    # first appearance survives the filters
+    df = df[~df['sr_number'].isin(seen) & ~df['sr_number'].duplicated()]
+    seen.update(df['sr_number'])
 
-print('Grabbing the 311 data from Chicago Data Portal. This may take ~20 minutes')
-with ThreadPoolExecutor(max_workers=7) as executor:
-    executor.map(grab_thousand_311s, range(1, 1800))
+    df = df[(df['duplicate'] != True) & (df['sr_short_code'] != '311IOC')]
 
-print('311 acquired! Cleaning..')
-df = pd.concat(pds, ignore_index=True).drop_duplicates('sr_number')
-df = df[df['duplicate'] != True]
-df = df[df['sr_short_code'] != '311IOC']
+    # Classes are looked up with a vectorized map; unclassified codes come
+    # back NaN and are dropped
+    df = df.assign(disorder_class=df['sr_short_code'].map(classes).astype(classes.dtype))
+    df = df[df['disorder_class'].notna()]
 
-print('Basic cleaning done, attaching classifications.')
+    df = df.assign(GEOID=assigner.assign(df['longitude'], df['latitude']))
+    return df[df['GEOID'].notna()].drop(['duplicate'], axis=1)
 
 with open('../../data/raw/311classification.json') as f:
     request_classes = json.loads(f.read())
 
-df['disorder_class'] = df['sr_short_code'].apply(lambda x: request_classes.get(x, 'MISSING'))
-df = df[df['disorder_class'] != 'MISSING']
-
-print('Classes attached and missing dropped!')
-print('Reading in spatial data to work with..')
+classes = pd.Series(request_classes, dtype='category')
+assigner = TractAssigner()
 
-# Get tracts
-tracts = pygris.tracts(state='IL', county='Cook', cb=True, year=2023)
-gdf = gpd.GeoDataFrame(df,
-        geometry=gpd.points_from_xy(df.longitude, df.latitude),
-        crs='EPSG:4326')
+print('Grabbing the 311 data from Chicago Data Portal. Finished pages are checkpointed, so this can be safely rerun.')
+loader = SocrataFriendo(DATASET, SELECT, where=where, order='sr_number DESC',
+                        checkpoint_dir=checkpoint_dir)
 
-print("Spatial data read in! Processing..")
+# Each page is cleaned and stored as soon as it arrives, so the pull holds
+# at most a few pages (plus the set of sr_numbers seen) in memory, and the
+# artifact is written back out a month at a time. Tracts
+# are only attached to the new rows; everything older is already sitting
+# in the store. The mark only moves once every page is stored, so an
+# interrupted run picks up where it left off.
+seen = set()
+n_pulled, n_kept = 0, 0
+for page in loader.iter_pages():
+    n_pulled += len(page)
+    page = clean_chunk(page, seen, classes, assigner)
+    n_kept += len(page)
+    store.upsert(page)
+store.advance_mark()
 
-tracts.to_crs('EPSG:26916', inplace=True)
-gdf.to_crs('EPSG:26916', inplace=True)
+print(f'{n_pulled} requests acquired, {n_kept} kept after cleaning and classification.')
 
-gdf = gdf.sjoin(
-    tracts[['GEOID', 'geometry']],
-    predicate='intersects'
-).drop(['index_right', 'duplicate', 'geometry'], axis=1)
+# Every page is in the store now. The checkpoint only describes the query,
+# so a later refresh with the same row count would replay it
+shutil.rmtree(checkpoint_dir, ignore_errors=True)
 
 print('Saving!')
-gdf.to_csv('../../data/311reqs.csv')
+write_artifact_parts(store.iter_partitions(), '311reqs', csv=args.csv)
 
@@ -2,12 +2,25 @@
 ### Date: 5/4/2024
 ### About: Script used to grab and clean 2023 CPD data.
 
-from concurrent.futures import ThreadPoolExecutor
-import pandas as pd
-import geopandas as gpd
-import pygris
+from IncrementalStore import IncrementalStore
+from SocrataFriendo import SocrataFriendo
+import argparse
+import shutil
+import sys
+import os
 
-URL = 'https://data.cityofchicago.org/resource/ijzp-q8t2.csv?$query=SELECT%0A%20%20%60id%60%2C%0A%20%20%60case_number%60%2C%0A%20%20%60date%60%2C%0A%20%20%60iucr%60%2C%0A%20%20%60primary_type%60%2C%0A%20%20%60description%60%2C%0A%20%20%60location_description%60%2C%0A%20%20%60arrest%60%2C%0A%20%20%60domestic%60%2C%0A%20%20%60beat%60%2C%0A%20%20%60district%60%2C%0A%20%20%60ward%60%2C%0A%20%20%60community_area%60%2C%0A%20%20%60fbi_code%60%2C%0A%20%20%60year%60%2C%0A%20%20%60latitude%60%2C%0A%20%20%60longitude%60%0AWHERE%20%60year%60%20IN%20(%222023%22)%0AORDER%20BY%20%60date%60%20DESC%20NULL%20FIRST'
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'spatial'))
+from TractAssigner import TractAssigner
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import write_artifact
+
+DATASET = 'ijzp-q8t2'
+SELECT = ['id', 'case_number', 'date', 'iucr', 'primary_type', 'description',
+          'location_description', 'arrest', 'domestic', 'beat', 'district',
+          'ward', 'community_area', 'fbi_code', 'year', 'updated_on', 'latitude', 'longitude']
+WHERE = 'year IN ("2023")'
+CHECKPOINT_DIR = '../../data/cache/portal/crime_2023'
+STORE_DIR = '../../data/portal_store/crime_2023'
 
 VIOLENT_CRIMES = [
     'BATTERY', 'HOMICIDE', 'ASSAULT', 'ROBBERY', 
@@ -17,44 +30,53 @@ VIOLENT_CRIMES = [
 
 NARCOTICS = ['NARCOTICS', 'OTHER NARCOTIC VIOLATION']
 
-def grab_thousand_crimes(lst, offset=0, URL=URL):
-    '''
-    Grab 1000 rows of crimes requests from the Chicago
-    '''
-    lst.append(pd.read_csv(URL+f'%20OFFSET%20{offset*1000}'))
-
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description='Grab and clean 2023 CPD data.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only pull crimes added or edited since the last run and upsert them into the store')
+    parser.add_argument('--csv', action='store_true', help='also export the crime CSVs')
+    args = parser.parse_args()
+
+    # Crimes are added and edited days to weeks after they occur, so the
+    # mark follows updated_on rather than date
+    store = IncrementalStore(STORE_DIR, key='id', timestamp='updated_on', partition_by='date')
+    where = WHERE
+    if args.incremental and store.high_water_mark() is not None:
+        print(f'Incremental run: grabbing crimes updated since {store.high_water_mark()}.')
+        where = f'({WHERE}) AND {store.since_clause()}'
+        checkpoint_dir = CHECKPOINT_DIR + '_delta'
+    else:
+        print('Full run: the store will be rebuilt from scratch.')
+        store.clear()
+        checkpoint_dir = CHECKPOINT_DIR
+
     print('Grabbing crime data...')
 
-    pds = []
-    
-    # we expect ~260,000 entries, so we offset higher for safety
-    with ThreadPoolExecutor(max_workers=7) as executor:
-        for i in range(270):
-            executor.submit(grab_thousand_crimes, pds, i)
-    
-    df = pd.concat(pds, ignore_index=True).drop_duplicates()
+    # id is unique, so paging on it is stable
+    loader = SocrataFriendo(DATASET, SELECT, where=where, order='id DESC',
+                            checkpoint_dir=checkpoint_dir)
+    df = loader.get().drop_duplicates()
 
     print('Grabbed! Attaching to tracts..')
-    tracts = pygris.tracts(state='IL', county='Cook', cb=True, year=2023)
-    gdf = gpd.GeoDataFrame(df,
-        geometry=gpd.points_from_xy(df.longitude, df.latitude),
-        crs='EPSG:4326')
-    
-    tracts.to_crs('EPSG:26916', inplace=True)
-    gdf.to_crs('EPSG:26916', inplace=True)
-
-    gdf = gdf.sjoin(
-        tracts[['GEOID', 'geometry']],
-        predicate='intersects'
-    ).drop(['index_right', 'geometry'], axis=1)
+    df = df.assign(GEOID=TractAssigner().assign(df['longitude'], df['latitude']))
+    df = df[df['GEOID'].notna()]
+
+    # Tracts are only attached to the new rows; everything older is already
+    # sitting in the store.
+    store.upsert(df)
+    store.advance_mark()
+
+    # Every page is in the store now. The checkpoint only describes the
+    # query, so a later refresh with the same row count would replay it
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    df = store.read()
 
     print('Attached! Splitting into violent and narcotic dataset..')
 
-    violent_df = gdf[gdf['primary_type'].isin(VIOLENT_CRIMES)]
-    narcotic_df = gdf[gdf['primary_type'].isin(NARCOTICS)]
+    violent_df = df[df['primary_type'].isin(VIOLENT_CRIMES)]
+    narcotic_df = df[df['primary_type'].isin(NARCOTICS)]
 
     print('Saving...')
-    violent_df.to_csv('../../data/violent_crime2023.csv')
-    narcotic_df.to_csv('../../data/narcotic_crime2023.csv')
\ No newline at end of file
+    write_artifact(violent_df, 'violent_crime2023', csv=args.csv)
+    write_artifact(narcotic_df, 'narcotic_crime2023', csv=args.csv)
\ No newline at end of file
@@ -0,0 +1,202 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Typed schemas for every artifact the pipeline produces, plus helpers
+###        to write them as Parquet (with an optional CSV export) and to read
+###        them back with column projection and predicate pushdown.
+
+import pyarrow.parquet as pq
+import pandas as pd
+import pyarrow as pa
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
+
+# Where each artifact lives, relative to data/ and without an extension
+PATHS = {
+    'censusdata':'censusdata',
+    '311reqs':'311reqs',
+    'violent_crime2023':'violent_crime2023',
+    'narcotic_crime2023':'narcotic_crime2023',
+    'streetview_locations_initial':'shapes/streetview_locations_initial',
+    'streetview_metadata_and_locs':'shapes/streetview_metadata_and_locs',
+    'streetview_panoramas':'shapes/streetview_panoramas',
+    'streetview_greenery':'streetview_greenery',
+}
+
+CRIME_SCHEMA = {
+    'id':'Int64', 'case_number':'string', 'date':'datetime', 'iucr':'string',
+    'primary_type':'category', 'description':'category',
+    'location_description':'category', 'arrest':'boolean', 'domestic':'boolean',
+    'beat':'Int64', 'district':'Int64', 'ward':'Int64', 'community_area':'Int64',
+    'fbi_code':'category', 'year':'Int64', 'updated_on':'datetime', 'latitude':'float64',
+    'longitude':'float64', 'GEOID':'string'
+}
+
+STREETVIEW_SCHEMA = {
+    'ID':'string', 'longitude':'float64', 'latitude':'float64',
+    'heading':'Int64', 'dates':'month', 'pano_id':'string', 'status':'category'
+}
+
+# Column -> type for each artifact. Columns not listed keep whatever type
+# they already have; any numeric census column not listed becomes float64.
+SCHEMAS = {
+    'censusdata':{'GEOID':'string'},
+    '311reqs':{
+        'sr_number':'string', 'sr_type':'category', 'sr_short_code':'category',
+        'created_date':'datetime', 'last_modified_date':'datetime', 'community_area':'Int64',
+        'latitude':'float64', 'longitude':'float64',
+        'disorder_class':'category', 'GEOID':'string'
+    },
+    'violent_crime2023':CRIME_SCHEMA,
+    'narcotic_crime2023':CRIME_SCHEMA,
+    'streetview_locations_initial':{'ID':'string', 'longitude':'float64', 'latitude':'float64'},
+    'streetview_metadata_and_locs':STREETVIEW_SCHEMA,
+    'streetview_panoramas':{'ID':'string', 'image_id':'string', 'pano_id':'string'},
+    'streetview_greenery':{
+        **STREETVIEW_SCHEMA, 'absolute_greenery':'float64',
+        'relative_greenery':'float64', 'relative_tree':'float64'
+    },
+}
+
+# Arrow type for each schema type, so artifacts written in parts agree on
+# one schema whatever each part's values happen to be
+ARROW_TYPES = {
+    'string':pa.string(), 'category':pa.dictionary(pa.int32(), pa.string()),
+    'datetime':pa.timestamp('ns'), 'month':pa.timestamp('ns'), 'Int64':pa.int64(),
+    'float64':pa.float64(), 'boolean':pa.bool_(),
+}
+
+def path_of(name, extension='parquet'):
+    '''
+    Returns (str): where an artifact lives on disk.
+    '''
+    assert name in PATHS, f'Unknown artifact {name}, must be one of {list(PATHS)}.'
+    return os.path.join(DATA_DIR, f'{PATHS[name]}.{extension}')
+
+def existing_path(name):
+    '''
+    Returns (str): the Parquet copy of an artifact if there is one, otherwise
+      its CSV export.
+    '''
+    if os.path.exists(path_of(name)):
+        return path_of(name)
+
+    return path_of(name, 'csv')
+
+def apply_schema(df, name):
+    '''
+    Cast the columns of df to the types listed for the artifact.
+
+    Returns: pandas DataFrame
+    '''
+    df = df.copy()
+    for col, dtype in SCHEMAS[name].items():
+        if col not in df.columns:
+            continue
+
+        if dtype == 'datetime':
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif dtype == 'month':
+            df[col] = pd.to_datetime(df[col], format='%Y-%m', errors='coerce')
+        elif dtype == 'string':
+            # GEOIDs written out by older CSVs come back as floats
+            values = df[col].astype('string')
+            df[col] = values.str.replace(r'\.0$', '', regex=True)
+        elif dtype in ['Int64', 'float64']:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        elif dtype == 'category':
+            # Categories of mixed types (e.g. codes read back as both ints
+            # and strs) can't be written to Parquet, so unify them first
+            df[col] = df[col].astype('string').astype('category')
+        else:
+            df[col] = df[col].astype(dtype)
+
+    if name == 'censusdata':
+        numeric = [col for col in df.columns if col != 'GEOID']
+        df[numeric] = df[numeric].astype('float64')
+
+    return df
+
+def write_artifact(df, name, csv=False):
+    '''
+    Write an artifact as Parquet with its schema applied.
+
+    Inputs:
+      df (DataFrame): the artifact.
+      name (str): which artifact this is; a key of PATHS.
+      csv (bool): also export a CSV copy next to the Parquet file. Defaults False.
+
+    Returns: None
+    '''
+    df = apply_schema(pd.DataFrame(df), name)
+
+    df.to_parquet(path_of(name), index=False)
+    if csv:
+        df.to_csv(path_of(name, 'csv'), index=False)
+
+def arrow_schema(df, name):
+    '''
+    Returns (pyarrow.Schema): the Arrow schema of an artifact, taking the
+      types listed in SCHEMAS and inferring the rest from df.
+    '''
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    return pa.schema([
+        pa.field(field.name, ARROW_TYPES[SCHEMAS[name][field.name]])
+        if field.name in SCHEMAS[name] else field
+        for field in inferred
+    ])
+
+def write_artifact_parts(parts, name, csv=False):
+    '''
+    Write an artifact one part at a time, so only one part is ever in
+    memory. Every part must have the same columns.
+
+    Inputs:
+      parts (iterable of DataFrame): the artifact, in pieces.
+      name (str): which artifact this is; a key of PATHS.
+      csv (bool): also export a CSV copy next to the Parquet file. Defaults False.
+
+    Returns: None
+    '''
+    path, csv_path = path_of(name), path_of(name, 'csv')
+    writer = None
+    try:
+        for part in parts:
+            part = apply_schema(pd.DataFrame(part), name)
+            first = writer is None
+            if first:
+                schema = arrow_schema(part, name)
+                writer = pq.ParquetWriter(f'{path}.tmp', schema)
+
+            writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+            if csv:
+                part.to_csv(f'{csv_path}.tmp', index=False, mode='w' if first else 'a', header=first)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    assert writer is not None, f'No parts given for {name}.'
+    os.replace(f'{path}.tmp', path)
+    if csv:
+        os.replace(f'{csv_path}.tmp', csv_path)
+
+def read_artifact(name, columns=None, filters=None):
+    '''
+    Read an artifact back. Only the requested columns and the row groups
+    matching filters are read from the Parquet file. Falls back on the CSV
+    export if no Parquet copy exists.
+
+    Inputs:
+      name (str): which artifact to read; a key of PATHS.
+      columns (list of str): columns to read. If None, reads all.
+      filters (list of tuples): pyarrow style filters, e.g.
+        [('primary_type', '==', 'NARCOTICS')]. If None, reads all rows.
+
+    Returns: pandas DataFrame
+    '''
+    path = existing_path(name)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns, filters=filters)
+
+    assert filters is None, 'filters are only supported on Parquet artifacts.'
+    return apply_schema(pd.read_csv(path, usecols=columns), name)
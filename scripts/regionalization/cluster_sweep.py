@@ -0,0 +1,108 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Sweeps connectivity-constrained agglomerative clustering over a range
+###        of cluster counts. The tree is fit once and cut at every k, and the
+###        metrics for each cut share one precomputed distance matrix.
+
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial.distance import pdist, squareform
+from sklearn.cluster import ward_tree
+from sklearn import metrics
+import pandas as pd
+import numpy as np
+
+METRICS = ['davies_bouldin', 'calinski_harabasz', 'silhouette']
+
+def cut_tree(children, n_leaves, n_clusters):
+    '''
+    Cut a merge tree (as returned by ward_tree) into n_clusters clusters by
+    applying its first n_leaves - n_clusters merges.
+
+    Inputs:
+      children (array): (n_merges, 2) array of the nodes merged at each step.
+      n_leaves (int): number of observations.
+      n_clusters (int): number of clusters wanted.
+
+    Returns: numpy array of cluster labels, numbered 0 to n_clusters - 1.
+    '''
+    n_merges = min(n_leaves - n_clusters, len(children))
+
+    # Every node merged in the first n_merges steps points at the node the
+    # merge created; everything else is its own root.
+    parent = np.arange(n_leaves + len(children))
+    parent[children[:n_merges].ravel()] = np.repeat(np.arange(n_leaves, n_leaves + n_merges), 2)
+
+    # Pointer jumping until every leaf points at its root
+    roots = parent[:n_leaves]
+    while True:
+        jumped = parent[roots]
+        if (jumped == roots).all():
+            break
+        roots = jumped
+
+    return np.unique(roots, return_inverse=True)[1]
+
+def sweep(X, connectivity=None, min_clusters=2, max_clusters=10, patience=None):
+    '''
+    Score ward clustering of X at every cluster count from min_clusters to
+    max_clusters. Ward clustering is deterministic, so one fit of the full
+    tree gives the same clusters as refitting AgglomerativeClustering for
+    each k.
+
+    Inputs:
+      X (array-like): observations to cluster. All values need to be numeric.
+      connectivity (sparse matrix): spatial weights constraining which
+        observations can merge, e.g. Queen(...).sparse. Defaults to None.
+      min_clusters (int): smallest number of clusters to score. Defaults to 2.
+      max_clusters (int): largest number of clusters to score. Defaults to 10.
+      patience (int): stop once the silhouette score has not improved for
+        this many cluster counts in a row. If None, scores every k.
+        Defaults to None.
+
+    Returns: pandas DataFrame of the Davies-Bouldin, Calinski-Harabasz and
+      silhouette scores, indexed by number of clusters.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    distances = squareform(pdist(X))
+    children = ward_tree(X, connectivity=connectivity)[0]
+
+    scores = {}
+    best, since_best = -np.inf, 0
+    for n_clusters in range(min_clusters, max_clusters + 1):
+        labels = cut_tree(children, len(X), n_clusters)
+        scores[n_clusters] = {
+            'davies_bouldin':metrics.davies_bouldin_score(X, labels),
+            'calinski_harabasz':metrics.calinski_harabasz_score(X, labels),
+            'silhouette':metrics.silhouette_score(distances, labels, metric='precomputed'),
+        }
+
+        if scores[n_clusters]['silhouette'] > best:
+            best, since_best = scores[n_clusters]['silhouette'], 0
+        else:
+            since_best += 1
+        if patience is not None and since_best >= patience:
+            break
+
+    return pd.DataFrame.from_dict(scores, orient='index', columns=METRICS)\
+        .rename_axis('n_clusters')
+
+def sweep_environments(environments, min_clusters=2, max_clusters=10, patience=None, max_workers=None):
+    '''
+    Run sweep() for several environments at once, one per worker process.
+
+    Inputs:
+      environments (dict): environment name -> (X, connectivity).
+      min_clusters, max_clusters, patience: passed on to sweep().
+      max_workers (int): number of worker processes. If None, one per CPU.
+        Defaults to None.
+
+    Returns (dict): environment name -> DataFrame of scores from sweep().
+    '''
+    names = list(environments)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(sweep, np.asarray(X, dtype=np.float64), connectivity,
+                            min_clusters, max_clusters, patience)
+            for X, connectivity in environments.values()
+        ]
+        return {name: future.result() for name, future in zip(names, futures)}
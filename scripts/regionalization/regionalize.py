@@ -0,0 +1,176 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Headless version of the regionalization in notebooks/clustering.ipynb.
+###        Each environment is scaled, optionally reduced with PCA, clustered
+###        under spatial weights and scored, in its own worker process, and
+###        the results are written to a results store for later comparison.
+
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.preprocessing import StandardScaler
+from sklearn.decomposition import PCA
+from sklearn import cluster
+import pandas as pd
+import argparse
+import datetime
+import json
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'spatial'))
+from WeightsStore import WeightsStore
+from tract_features import build_tract_features, DATA_DIR
+from cluster_sweep import sweep
+
+RESULTS_DIR = os.path.join(DATA_DIR, 'regionalization')
+
+# Environment -> the tract features it is clustered on
+ENVIRONMENTS = {
+    'social':['social_311s', 'MHSdP', 'RPL_THEMES', 'violent_crime_rate', 'WhiteP',
+              'BlackP', 'AsianP', 'HispP', '18to24P', 'Ovr65P'],
+    'econ':['economic_311s', 'MedInc', 'PovP', 'Unemployment', 'HighRiskJobP', 'NoIntP'],
+    'physical':['physical_311s', 'relative_greenery', 'VacantP'],
+    'policy':['minDisHosp', 'metMinDis', 'bupMinDis', 'minDist_OTP', 'minDisMH'],
+}
+
+def prepare(df, n_components=None):
+    '''
+    Scale every variable, then optionally replace them with their first
+    n_components principal components.
+
+    Inputs:
+      df (DataFrame): numeric variables, indexed by GEOID.
+      n_components (int): principal components to keep. If None, no PCA.
+        Defaults to None.
+
+    Returns: pandas DataFrame of the prepared variables, indexed by GEOID.
+    '''
+    scaled = pd.DataFrame(StandardScaler().fit_transform(df), columns=df.columns, index=df.index)
+    if n_components is None:
+        return scaled
+
+    components = PCA(n_components=n_components).fit_transform(scaled)
+    return pd.DataFrame(components, columns=[f'pca{i+1}' for i in range(n_components)], index=df.index)
+
+def run_environment(name, df, connectivity, config):
+    '''
+    Regionalize one environment: scale -> PCA -> sweep -> cluster.
+
+    Inputs:
+      name (str): the environment's name.
+      df (DataFrame): the environment's variables, indexed by GEOID, with no
+        missing values.
+      connectivity (sparse matrix): spatial weights between the tracts of
+        df, in the same order.
+      config (dict): run settings; see main().
+
+    Returns (dict): the environment name, the scores from the sweep, the
+      chosen number of clusters, and the cluster label of each tract.
+    '''
+    X = prepare(df, config['n_components'])
+
+    scores = sweep(X, connectivity, config['min_clusters'], config['max_clusters'])
+
+    n_clusters = config['n_clusters'].get(name)
+    if n_clusters is None:
+        n_clusters = int(scores['silhouette'].idxmax())
+
+    labels = cluster.AgglomerativeClustering(n_clusters=n_clusters, connectivity=connectivity)\
+        .fit(X)\
+        .labels_
+
+    return {'environment':name, 'scores':scores, 'n_clusters':n_clusters,
+            'labels':pd.DataFrame({'GEOID':X.index, 'labels':labels})}
+
+def write_results(result, run_dir, config, columns):
+    '''
+    Write one environment's results to run_dir/<environment>/.
+
+    Returns: None
+    '''
+    env_dir = os.path.join(run_dir, result['environment'])
+    os.makedirs(env_dir, exist_ok=True)
+
+    result['scores'].reset_index().to_parquet(os.path.join(env_dir, 'scores.parquet'), index=False)
+    result['labels'].to_parquet(os.path.join(env_dir, 'labels.parquet'), index=False)
+    with open(os.path.join(env_dir, 'run.json'), 'w') as f:
+        json.dump({**config, 'columns':columns, 'chosen_clusters':result['n_clusters']}, f, indent=2)
+
+def regionalize(environments, config, max_workers=None):
+    '''
+    Regionalize several environments in parallel and store the results.
+
+    Inputs:
+      environments (dict): environment name -> list of feature columns.
+      config (dict): run settings; see main().
+      max_workers (int): number of worker processes. If None, one per CPU.
+        Defaults to None.
+
+    Returns (str): the folder the run was written to.
+    '''
+    tract_data = build_tract_features().set_index('GEOID')
+
+    # Built (or loaded) once here, so workers don't race to write the cache;
+    # each worker only gets its environment's slice
+    weights = WeightsStore()
+
+    run_dir = os.path.join(config['results_dir'], config['run'])
+    print(f'Regionalizing {len(environments)} environments into {run_dir}.')
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for name, columns in environments.items():
+            missing = [col for col in columns if col not in tract_data.columns]
+            if len(missing) > 0:
+                print(f'Skipping {name}, missing features {missing}.')
+                continue
+
+            df = tract_data[columns].dropna()
+            if config['weights'] == 'knn':
+                connectivity = weights.knn_for(df.index, config['k'])
+            else:
+                connectivity = weights.queen_for(df.index)
+
+            futures[name] = executor.submit(run_environment, name, df, connectivity, config)
+
+        for name, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f'{name} failed with {e}.')
+                continue
+
+            write_results(result, run_dir, config, environments[name])
+            print(f'{name}: {result["n_clusters"]} clusters over {len(result["labels"])} tracts.')
+
+    return run_dir
+
+def main():
+    parser = argparse.ArgumentParser(description='Regionalize tracts into risk environments.')
+    parser.add_argument('--environments', nargs='+', default=list(ENVIRONMENTS),
+                        choices=list(ENVIRONMENTS), help='environments to run; defaults to all')
+    parser.add_argument('--weights', choices=['queen', 'knn'], default='queen')
+    parser.add_argument('--k', type=int, default=6, help='neighbors for knn weights')
+    parser.add_argument('--n-components', type=int, default=None,
+                        help='principal components to keep; no PCA if not given')
+    parser.add_argument('--min-clusters', type=int, default=2)
+    parser.add_argument('--max-clusters', type=int, default=10)
+    parser.add_argument('--n-clusters', nargs='+', default=[], metavar='ENV=K',
+                        help='fix the number of clusters for an environment, e.g. econ=5; '
+                             'otherwise the best silhouette score is used')
+    parser.add_argument('--run', default=None, help='name of the run; defaults to a timestamp')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--max-workers', type=int, default=None)
+    args = parser.parse_args()
+
+    config = {
+        'weights':args.weights, 'k':args.k, 'n_components':args.n_components,
+        'min_clusters':args.min_clusters, 'max_clusters':args.max_clusters,
+        'n_clusters':{env: int(k) for env, k in (pair.split('=') for pair in args.n_clusters)},
+        'run':args.run or datetime.datetime.now().strftime('%Y%m%dT%H%M%S'),
+        'results_dir':args.results_dir,
+    }
+
+    regionalize({env: ENVIRONMENTS[env] for env in args.environments}, config, args.max_workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Builds the tract x feature matrix the regionalization runs on, from
+###        the pipeline artifacts and the external SVI and access tables. The
+###        matrix is cached, and only rebuilt when one of its inputs changes.
+
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'spatial'))
+from GeometryStore import GeometryStore
+from TractAssigner import TractAssigner
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from artifacts import DATA_DIR, existing_path, read_artifact
+
+CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'features')
+
+# Bump whenever the way features are built changes, so old caches are ignored
+FEATURES_VERSION = 1
+
+ARTIFACT_INPUTS = ['censusdata', '311reqs', 'violent_crime2023',
+                   'narcotic_crime2023', 'streetview_greenery']
+
+# External tables: file -> the columns we keep from it. Every table is keyed
+# on a GEOID column, except SVI which calls it FIPS.
+EXTERNAL_INPUTS = {
+    'illinois_svi_2022.csv':['RPL_THEMES'],
+    'access/hospital_access.csv':['minDisHosp'],
+    'access/moud_access.csv':['metMinDis', 'bupMinDis'],
+    'access/otp_access.csv':['minDist_OTP'],
+    'access/mh_access.csv':['minDisMH'],
+}
+
+DISORDER_CLASSES = {'PHYSICAL':'physical_311s', 'ECONOMIC':'economic_311s', 'SOCIAL':'social_311s'}
+
+# Counts which are turned into rates per 1000 residents
+RATE_COLUMNS = ['violent_crime_count', 'narcotic_crime_count', 'economic_311s',
+                'social_311s', 'physical_311s']
+
+def geoid_keys(geoids):
+    '''
+    Turn GEOIDs, however they were stored (str, int, float), into integer keys.
+
+    Returns: numpy int64 array, with -1 where a GEOID is missing.
+    '''
+    keys = pd.to_numeric(pd.Series(geoids), errors='coerce')
+    return keys.fillna(-1).to_numpy(dtype=np.int64)
+
+def input_paths():
+    '''
+    Returns (list of str): every file the feature matrix is built from.
+    '''
+    return [existing_path(name) for name in ARTIFACT_INPUTS] + \
+           [os.path.join(DATA_DIR, table) for table in EXTERNAL_INPUTS]
+
+def input_hashes():
+    '''
+    Returns (dict): sha256 of each input file, keyed on its path relative to data/.
+    '''
+    hashes = {}
+    for path in input_paths():
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        hashes[os.path.relpath(path, DATA_DIR)] = digest.hexdigest()
+
+    return hashes
+
+def build_tract_features(store=None, refresh=False):
+    '''
+    Get the tract x feature matrix for every Chicago tract: census
+    variables, relative greenery, 311 and crime rates per 1000 residents,
+    SVI, and the access distances.
+
+    Inputs:
+      store (GeometryStore): where the tracts come from. Defaults to the
+        default Cook County store.
+      refresh (bool): rebuild even if the cached matrix is up to date.
+        Defaults to False.
+
+    Returns: GeoDataFrame with one row per tract, a string GEOID, and the
+      tract geometry in EPSG:26916.
+    '''
+    store = store or GeometryStore()
+
+    manifest = {'version':FEATURES_VERSION, 'tracts':store.name, 'inputs':input_hashes()}
+    cache_path = os.path.join(CACHE_DIR, f'tract_features_{store.name}.parquet')
+    manifest_path = os.path.join(CACHE_DIR, f'tract_features_{store.name}.json')
+
+    if not refresh and os.path.exists(cache_path) and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                return gpd.read_parquet(cache_path)
+
+    print('Inputs changed since the feature matrix was last built, rebuilding.')
+    tract_data = aggregate(store)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tract_data.to_parquet(f'{cache_path}.tmp')
+    os.replace(f'{cache_path}.tmp', cache_path)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+    return tract_data
+
+def aggregate(store):
+    '''
+    Build the feature matrix from scratch. Every source is reduced onto the
+    same integer tract index with bincounts or a reindex, so there is no
+    chain of merges and no GEOID string wrangling.
+
+    Returns: GeoDataFrame of tract features.
+    '''
+    tracts = store.chicago_tracts()
+    index = pd.Index(geoid_keys(tracts['GEOID']))
+    n_tracts = len(index)
+
+    def positions(geoids):
+        # Row of each GEOID in the tract index, -1 if it isn't a Chicago tract
+        return index.get_indexer(geoid_keys(geoids))
+
+    def counts(geoids):
+        pos = positions(geoids)
+        return np.bincount(pos[pos >= 0], minlength=n_tracts)
+
+    features = {}
+
+    # Greenery: summed per tract, then min-max scaled over the tracts with imagery
+    streetview = read_artifact('streetview_greenery', columns=['longitude', 'latitude', 'absolute_greenery'])
+    pos = positions(TractAssigner(store.state, store.county, store.year, store.store_dir)\
+                    .assign(streetview['longitude'], streetview['latitude']))
+    keep = pos >= 0
+    greenery = np.bincount(pos[keep], weights=streetview['absolute_greenery'].to_numpy()[keep], minlength=n_tracts)
+    has_imagery = np.bincount(pos[keep], minlength=n_tracts) > 0
+
+    relative = np.zeros(n_tracts)
+    if has_imagery.any():
+        low, high = greenery[has_imagery].min(), greenery[has_imagery].max()
+        relative[has_imagery] = (greenery[has_imagery] - low) / (high - low)
+    features['relative_greenery'] = relative
+
+    # 311s: one bincount over (tract, class) pairs
+    threeoneone = read_artifact('311reqs', columns=['GEOID', 'disorder_class'])
+    classes = pd.Categorical(threeoneone['disorder_class'], categories=list(DISORDER_CLASSES))
+    pos = positions(threeoneone['GEOID'])
+    keep = (pos >= 0) & (classes.codes >= 0)
+    by_class = np.bincount(pos[keep] * len(DISORDER_CLASSES) + classes.codes[keep],
+                           minlength=n_tracts * len(DISORDER_CLASSES))\
+                 .reshape(n_tracts, len(DISORDER_CLASSES))
+    for i, name in enumerate(DISORDER_CLASSES.values()):
+        features[name] = by_class[:, i]
+
+    features['violent_crime_count'] = counts(read_artifact('violent_crime2023', columns=['GEOID'])['GEOID'])
+    features['narcotic_crime_count'] = counts(read_artifact('narcotic_crime2023', columns=['GEOID'])['GEOID'])
+
+    # Attribute tables are already one row per tract, so they only need reindexing
+    tables = [read_artifact('censusdata')]
+    for table, columns in EXTERNAL_INPUTS.items():
+        df = pd.read_csv(os.path.join(DATA_DIR, table)).rename({'FIPS':'GEOID'}, axis=1)
+        tables.append(df[['GEOID'] + columns])
+
+    attributes = [
+        df.assign(GEOID=geoid_keys(df['GEOID']))\
+          .drop_duplicates('GEOID')\
+          .set_index('GEOID')\
+          .reindex(index)
+        for df in tables
+    ]
+
+    tract_data = pd.concat([attributes[0], pd.DataFrame(features, index=index)] + attributes[1:], axis=1)
+
+    for col in RATE_COLUMNS:
+        tract_data[col] = 1000 * tract_data[col] / tract_data['TotalPopulation']
+
+    tract_data = tract_data.rename({
+        'violent_crime_count':'violent_crime_rate',
+        'narcotic_crime_count':'narcotic_crime_rate'
+        }, axis=1)
+
+    tract_data.insert(0, 'GEOID', tracts['GEOID'].to_numpy())
+    return gpd.GeoDataFrame(tract_data.reset_index(drop=True), geometry=tracts.geometry.values, crs=tracts.crs)
@@ -0,0 +1,110 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Local store of the tract and city boundary layers every stage of the
+###        pipeline works with, pinned to one vintage and pre-projected so
+###        scripts read them from disk instead of re-downloading them.
+
+import geopandas as gpd
+import pygris
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
+STORE_DIR = os.path.join(DATA_DIR, 'cache', 'geometry')
+BOUNDARIES_PATH = os.path.join(DATA_DIR, 'shapes', 'chicago_boundaries.geojson')
+
+# Pin the tract vintage so every stage agrees on the same tracts
+TRACT_YEAR = 2023
+CRS = 'EPSG:26916'
+
+class GeometryStore:
+    '''
+    Pinned-vintage, pre-projected (EPSG:26916) tract and Chicago boundary
+    layers, kept as GeoParquet.
+    '''
+
+    def __init__(self, state='IL', county='Cook', year=TRACT_YEAR, store_dir=STORE_DIR):
+        '''
+        Arguments:
+          state (str): state to pull tracts for. Defaults to 'IL'.
+          county (str): county to pull tracts for. Defaults to 'Cook'.
+          year (int): tract vintage. Defaults to TRACT_YEAR.
+          store_dir (str): folder holding the layers. Defaults to
+            data/cache/geometry.
+        '''
+        self.state = state
+        self.county = county
+        self.year = year
+        self.store_dir = store_dir
+        self.name = f'{state}_{county}_{year}'.lower()
+
+        os.makedirs(store_dir, exist_ok=True)
+
+    def tracts(self):
+        '''
+        Returns: GeoDataFrame of tract GEOIDs and geometries in EPSG:26916.
+          Pulled with pygris the first time only.
+        '''
+        path = os.path.join(self.store_dir, f'tracts_{self.name}.parquet')
+        if os.path.exists(path):
+            return gpd.read_parquet(path)
+
+        tracts = pygris.tracts(state=self.state, county=self.county, cb=True, year=self.year)\
+            [['GEOID', 'geometry']]\
+            .to_crs(CRS)\
+            .reset_index(drop=True)
+        tracts.to_parquet(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+
+        return tracts
+
+    def chicago_boundaries(self):
+        '''
+        Returns: GeoDataFrame of the Chicago city boundary in EPSG:26916.
+        '''
+        path = os.path.join(self.store_dir, 'chicago_boundaries.parquet')
+        if os.path.exists(path):
+            return gpd.read_parquet(path)
+
+        boundaries = gpd.read_file(BOUNDARIES_PATH).to_crs(CRS)
+        boundaries.to_parquet(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+
+        return boundaries
+
+    def chicago_geoids(self):
+        '''
+        Returns: list of GEOIDs of the tracts whose centroid is inside the
+          Chicago city boundary.
+        '''
+        path = os.path.join(self.store_dir, f'chicago_geoids_{self.name}.txt')
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read().split()
+
+        tracts = self.tracts()
+        geoids = gpd\
+            .sjoin(
+                self.chicago_boundaries(),
+                gpd.GeoDataFrame(
+                    tracts.drop('geometry', axis=1),
+                    geometry=tracts.centroid,
+                    crs=CRS
+                ),
+                predicate='contains'
+            )['GEOID']\
+            .drop_duplicates()\
+            .sort_values()\
+            .tolist()
+
+        with open(f'{path}.tmp', 'w') as f:
+            f.write('\n'.join(geoids))
+        os.replace(f'{path}.tmp', path)
+
+        return geoids
+
+    def chicago_tracts(self):
+        '''
+        Returns: GeoDataFrame of just the tracts in Chicago.
+        '''
+        tracts = self.tracts()
+        return tracts[tracts['GEOID'].isin(self.chicago_geoids())].reset_index(drop=True)
@@ -0,0 +1,68 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Shared point-in-tract assignment. Tract geometries come from the
+###        local GeometryStore, are indexed with an STRtree, and points are
+###        assigned to GEOIDs in vectorized chunks without building a
+###        GeoDataFrame.
+
+from GeometryStore import GeometryStore, TRACT_YEAR, STORE_DIR, CRS
+from pyproj import Transformer
+import numpy as np
+import shapely
+
+class TractAssigner:
+    '''
+    Assigns lat/lon points to the Census tracts containing them.
+    '''
+
+    def __init__(self, state='IL', county='Cook', year=TRACT_YEAR, store_dir=STORE_DIR):
+        '''
+        Load the tracts from the GeometryStore and build their spatial index.
+        Building the index is quick next to loading the tracts, so it isn't
+        cached.
+
+        Arguments:
+          state (str): state to pull tracts for. Defaults to 'IL'.
+          county (str): county to pull tracts for. Defaults to 'Cook'.
+          year (int): tract vintage. Defaults to TRACT_YEAR.
+          store_dir (str): folder holding the tracts.
+            Defaults to data/cache/geometry.
+        '''
+        store = GeometryStore(state, county, year, store_dir)
+        self.tracts = store.tracts()
+
+        self.tree = shapely.STRtree(self.tracts.geometry.values)
+
+        self.geoids = self.tracts['GEOID'].to_numpy(dtype=object)
+        self.transformer = Transformer.from_crs('EPSG:4326', CRS, always_xy=True)
+
+    def assign(self, longitude, latitude, chunk_size=500000):
+        '''
+        Find the tract containing each point.
+
+        Inputs:
+          longitude (array-like): WGS84 longitudes.
+          latitude (array-like): WGS84 latitudes, same length as longitude.
+          chunk_size (int): points to process at once, to bound memory.
+            Defaults to 500000.
+
+        Returns: numpy array of GEOID strings, with None where a point has no
+          coordinates or falls outside every tract. Points on a shared
+          boundary go to only one of the tracts they touch.
+        '''
+        longitude = np.asarray(longitude, dtype=np.float64)
+        latitude = np.asarray(latitude, dtype=np.float64)
+        assert len(longitude) == len(latitude), 'longitude and latitude must be the same length.'
+
+        rv = np.full(len(longitude), None, dtype=object)
+        for start in range(0, len(longitude), chunk_size):
+            end = start + chunk_size
+            x, y = self.transformer.transform(longitude[start:end], latitude[start:end])
+
+            point_idx, tract_idx = self.tree.query(shapely.points(x, y), predicate='intersects')
+
+            # Keep one hit per point, so boundary points aren't double counted
+            point_idx, first = np.unique(point_idx, return_index=True)
+            rv[start + point_idx] = self.geoids[tract_idx[first]]
+
+        return rv
@@ -0,0 +1,112 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Spatial weights for the Chicago tracts. Queen contiguity is built once
+###        for the full tract set and kept on disk as a sparse matrix, and the
+###        weights for any subset of tracts are sliced out of it.
+
+from GeometryStore import GeometryStore, TRACT_YEAR, STORE_DIR
+from scipy.spatial import cKDTree
+from libpysal.weights import Queen
+import scipy.sparse as sp
+import pandas as pd
+import numpy as np
+import os
+
+class WeightsStore:
+    '''
+    Cached Queen contiguity and tract centroids for the Chicago tracts, from
+    which the weights of any subset of tracts are derived.
+    '''
+
+    def __init__(self, state='IL', county='Cook', year=TRACT_YEAR, store_dir=STORE_DIR):
+        '''
+        Load the full Queen weights and centroids from disk, building them
+        from the GeometryStore only the first time.
+
+        Arguments:
+          state (str): state the tracts are in. Defaults to 'IL'.
+          county (str): county the tracts are in. Defaults to 'Cook'.
+          year (int): tract vintage. Defaults to TRACT_YEAR.
+          store_dir (str): folder holding the weights. Defaults to
+            data/cache/geometry.
+        '''
+        store = GeometryStore(state, county, year, store_dir)
+
+        queen_path = os.path.join(store_dir, f'queen_{store.name}.npz')
+        centroids_path = os.path.join(store_dir, f'centroids_{store.name}.npy')
+        geoids_path = os.path.join(store_dir, f'weights_geoids_{store.name}.txt')
+
+        if os.path.exists(queen_path) and os.path.exists(centroids_path) and os.path.exists(geoids_path):
+            self.queen = sp.load_npz(queen_path).tocsr()
+            self.centroids = np.load(centroids_path)
+            with open(geoids_path) as f:
+                geoids = f.read().split()
+        else:
+            tracts = store.chicago_tracts()
+            geoids = tracts['GEOID'].tolist()
+
+            # The sparse matrix follows the row order of the tracts
+            self.queen = Queen.from_dataframe(tracts, use_index=False).sparse.tocsr()
+            self.centroids = np.column_stack([tracts.centroid.x, tracts.centroid.y])
+
+            # Each file is written to a temporary name and moved into place,
+            # GEOIDs last, so an interrupted build is never mistaken for a
+            # finished one
+            with open(f'{queen_path}.tmp', 'wb') as f:
+                sp.save_npz(f, self.queen)
+            os.replace(f'{queen_path}.tmp', queen_path)
+            with open(f'{centroids_path}.tmp', 'wb') as f:
+                np.save(f, self.centroids)
+            os.replace(f'{centroids_path}.tmp', centroids_path)
+            with open(f'{geoids_path}.tmp', 'w') as f:
+                f.write('\n'.join(geoids))
+            os.replace(f'{geoids_path}.tmp', geoids_path)
+
+        self.geoids = pd.Index(geoids)
+
+    def positions(self, geoids):
+        '''
+        Returns: numpy array of the row of each GEOID in the full weights.
+        '''
+        pos = self.geoids.get_indexer(pd.Index(geoids).astype(str))
+        assert (pos >= 0).all(), 'Every GEOID must be a Chicago tract.'
+        return pos
+
+    def queen_for(self, geoids):
+        '''
+        Queen contiguity between a subset of tracts. Two tracts in the subset
+        are neighbors exactly when they are neighbors in the full set, so
+        this is just the matching rows and columns of the full matrix.
+
+        Inputs:
+          geoids (list of str): the tracts, in the order wanted.
+
+        Returns: scipy CSR matrix, usable as an AgglomerativeClustering
+          connectivity.
+        '''
+        pos = self.positions(geoids)
+        return self.queen[pos][:, pos]
+
+    def knn_for(self, geoids, k=6):
+        '''
+        k-nearest-neighbor weights between a subset of tracts, by centroid
+        distance. Unlike Queen weights these can't be sliced from the full
+        set, since a tract's nearest neighbors may not be in the subset, so
+        they are recomputed from the stored centroids.
+
+        Inputs:
+          geoids (list of str): the tracts, in the order wanted.
+          k (int): neighbors per tract. Defaults to 6.
+
+        Returns: scipy CSR matrix, where row i marks the k nearest neighbors of
+          tract i.
+        '''
+        centroids = self.centroids[self.positions(geoids)]
+        assert k < len(centroids), 'k must be smaller than the number of tracts.'
+
+        # The nearest point to each centroid is itself, so ask for one extra
+        neighbors = cKDTree(centroids).query(centroids, k=k + 1)[1][:, 1:]
+
+        rows = np.repeat(np.arange(len(centroids)), k)
+        return sp.csr_matrix((np.ones(len(rows)), (rows, neighbors.ravel())),
+                             shape=(len(centroids), len(centroids)))
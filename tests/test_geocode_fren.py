@@ -0,0 +1,115 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Checks that GeocodeFren only pays for each unique address and city
+###        fallback once, retries throttled requests, and that responses
+###        cached by ResponseCache are never handed to a different address.
+
+from urllib.parse import urlsplit, parse_qs
+import json
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'GoogleApiBuddy'))
+
+# Addresses which only differ in where the spaces fall
+ADDRESSES = [('12 34TH ST', 'CHICAGO', 'IL'), ('123 4TH ST', 'CHICAGO', 'IL')]
+LOCATIONS = {'12 34TH ST CHICAGO IL':(41.1, -87.1), '123 4TH ST CHICAGO IL':(41.2, -87.2),
+             ' CHICAGO IL':(41.9, -87.6)}
+
+class FakeResponse:
+    def __init__(self, body):
+        self.content = json.dumps(body).encode()
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+class FakeSession:
+    '''
+    Stands in for requests.Session, answering with a different location
+    for each address in LOCATIONS and ZERO_RESULTS for anything else. The
+    first n_throttled calls are answered with OVER_QUERY_LIMIT.
+    '''
+
+    def __init__(self, n_throttled=0):
+        self.addresses = []
+        self.n_throttled = n_throttled
+
+    @property
+    def calls(self):
+        return len(self.addresses)
+
+    def get(self, url):
+        address = parse_qs(urlsplit(url).query, keep_blank_values=True)['address'][0]
+        self.addresses.append(address)
+
+        if self.calls <= self.n_throttled:
+            return FakeResponse({'status':'OVER_QUERY_LIMIT'})
+        if address not in LOCATIONS:
+            return FakeResponse({'status':'ZERO_RESULTS', 'results':[]})
+
+        lat, lng = LOCATIONS[address]
+        return FakeResponse({'status':'OK', 'results':[{'geometry':{'location':{'lat':lat, 'lng':lng}}}]})
+
+def make_geocoder(**kwargs):
+    pytest.importorskip('requests')
+    pytest.importorskip('pandas')
+    from GeocodeFren import GeocodeFren
+
+    geocoder = GeocodeFren('secret', backoff=0, **kwargs)
+    geocoder.session = FakeSession()
+    return geocoder
+
+def test_duplicate_addresses_are_geocoded_once():
+    geocoder = make_geocoder()
+
+    # The same address, spelled three ways
+    located = geocoder.geocode_addresses([('123 4th St.', 'Chicago', 'IL'),
+                                          ('123  4TH ST', 'CHICAGO', 'IL'),
+                                          ('123 4TH ST', 'chicago,', 'IL')])
+
+    assert geocoder.session.calls == 1
+    assert list(zip(located['lat'], located['long'])) == [LOCATIONS['123 4TH ST CHICAGO IL']] * 3
+
+def test_city_fallback_is_resolved_once():
+    geocoder = make_geocoder()
+
+    located = geocoder.geocode_addresses([('1 NOWHERE AVE', 'CHICAGO', 'IL'),
+                                          ('2 NOWHERE AVE', 'CHICAGO', 'IL')])
+
+    # Two failed addresses, then one shared city/state lookup
+    assert sorted(geocoder.session.addresses) == [' CHICAGO IL', '1 NOWHERE AVE CHICAGO IL',
+                                                  '2 NOWHERE AVE CHICAGO IL']
+    assert list(zip(located['lat'], located['long'])) == [LOCATIONS[' CHICAGO IL']] * 2
+
+def test_throttled_requests_are_retried():
+    geocoder = make_geocoder(max_retries=3)
+    geocoder.session.n_throttled = 2
+
+    located = geocoder.geocode_addresses([ADDRESSES[1]])
+
+    assert geocoder.session.calls == 3
+    assert (located['lat'][0], located['long'][0]) == LOCATIONS['123 4TH ST CHICAGO IL']
+
+def test_geocoding_through_cache_keeps_addresses_apart(tmp_path):
+    pytest.importorskip('requests')
+    pytest.importorskip('pandas')
+    from ResponseCache import ResponseCache
+    from GeocodeFren import GeocodeFren
+
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    geocoder = GeocodeFren('secret', cache=cache)
+    geocoder.session = FakeSession()
+
+    # First run fills the cache, second run is served from it
+    for _ in range(2):
+        located = geocoder.geocode_addresses(ADDRESSES)
+        assert list(zip(located['lat'], located['long'])) == [LOCATIONS['12 34TH ST CHICAGO IL'],
+                                                               LOCATIONS['123 4TH ST CHICAGO IL']]
+
+    assert geocoder.session.calls == len(ADDRESSES)
+    cache.close()
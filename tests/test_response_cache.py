@@ -0,0 +1,66 @@
+### Author: Ashlynn Wimer
+### Date: 10/17/2026
+### About: Checks that ResponseCache keys keep distinct requests apart, and
+###        that only final API statuses are cached.
+
+import json
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'GoogleApiBuddy'))
+
+class FakeResponse:
+    def __init__(self, body):
+        self.content = json.dumps(body).encode()
+        self.ok = True
+
+class FakeSession:
+    '''
+    Stands in for requests.Session, answering with each status in turn.
+    '''
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def get(self, url):
+        self.calls += 1
+        return FakeResponse({'status':self.statuses.pop(0)})
+
+def geocode_url(address):
+    return f'https://maps.googleapis.com/maps/api/geocode/json?address={address}&key=secret'
+
+def test_cache_keys_keep_spacing():
+    pytest.importorskip('requests')
+    from ResponseCache import ResponseCache
+
+    # Addresses which only differ in where the spaces fall
+    assert ResponseCache.cache_key(geocode_url('12 34TH ST CHICAGO IL')) != \
+           ResponseCache.cache_key(geocode_url('123 4TH ST CHICAGO IL'))
+
+    # Extra whitespace alone still maps to the same entry
+    assert ResponseCache.cache_key(geocode_url('123  4TH ST CHICAGO IL')) == \
+           ResponseCache.cache_key(geocode_url('123 4TH ST CHICAGO IL'))
+
+def test_error_statuses_are_not_cached(tmp_path):
+    pytest.importorskip('requests')
+    from ResponseCache import ResponseCache
+
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    session = FakeSession(['OVER_QUERY_LIMIT', 'OK', 'REQUEST_DENIED'])
+    url = geocode_url('123 4TH ST CHICAGO IL')
+
+    # The throttled answer is returned but asked again; the OK one sticks
+    assert cache.fetch_json(url, session)['status'] == 'OVER_QUERY_LIMIT'
+    assert cache.fetch_json(url, session)['status'] == 'OK'
+    assert cache.fetch_json(url, session)['status'] == 'OK'
+    assert session.calls == 2
+
+    # An error body already sitting in the cache is not replayed
+    other = geocode_url('12 34TH ST CHICAGO IL')
+    cache.put(other, json.dumps({'status':'REQUEST_DENIED'}).encode())
+    session.statuses = ['OK']
+    assert cache.fetch_json(other, session)['status'] == 'OK'
+    cache.close()